@@ -0,0 +1,88 @@
+import itertools
+import time
+from datetime import date
+
+from licenses import PLANS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # 없으면 같은 값을 파이썬 반복문으로 계산함 (결과는 같고 느리기만 함)
+
+WEEK = 7 * 24 * 60 * 60
+
+# /분석 에 쓰는 집계, store.user_columns() 의 열 (array) 과 탈퇴 시각 목록으로 계산함
+# numpy 가 있으면 array 를 복사하지 않고 그대로 ndarray 로 보고 열마다 한 번씩만 훑음
+# <열>_weights 가 있으면 그 열의 값 하나가 여러 명을 뜻함 (sqlite 는 GROUP BY 로 묶어서 줌)
+
+def _weekly_numpy(values, weights, origin, weeks, unit):
+    # origin 부터 unit 단위로 몇 번째 칸인지 세서 앞의 weeks 칸만 돌려줌, origin 보다 작은 값은 빠짐
+    index = (values - origin) // unit
+    mask = (index >= 0) & (index < weeks)
+    counts = np.bincount(index[mask], weights=weights[mask] if weights is not None else None, minlength=weeks)
+    return counts.astype(np.int64).tolist()
+
+def _weekly_python(values, weights, origin, weeks, unit):
+    counts = [0] * weeks
+    for value, weight in zip(values, weights):
+        index = (value - origin) // unit
+        if 0 <= index < weeks:
+            counts[index] += weight
+    return counts
+
+def _summarize_numpy(columns, churn_times, today, now, weeks):
+    def column(name, dtype):
+        weights = columns.get(name + '_weights')
+        values = np.frombuffer(columns[name], dtype=dtype).astype(np.int64)
+        return values, np.frombuffer(weights, dtype=np.int64) if weights is not None else None
+
+    plan, plan_weights = column('plan', np.int8)
+    expiry, expiry_weights = column('expiry', np.int64)
+    created, created_weights = column('created', np.int64)
+    churn = np.frombuffer(churn_times, dtype=np.int64)
+    expired = expiry < today
+    return {
+        'total': int(plan_weights.sum()) if plan_weights is not None else len(plan),
+        'plans': np.bincount(plan, weights=plan_weights, minlength=len(PLANS)).astype(np.int64).tolist(),
+        'expired': int(expiry_weights[expired].sum()) if expiry_weights is not None else int(expired.sum()),
+        'expiring': _weekly_numpy(expiry, expiry_weights, today, weeks, 7),
+        # 지금부터 거꾸로 센 주 (0 이 이번 주), now - 값 으로 바꿔서 같은 함수를 씀
+        'registered': _weekly_numpy(now - created, created_weights, 0, weeks, WEEK),
+        'unregistered': _weekly_numpy(now - churn, None, 0, weeks, WEEK),
+    }
+
+def _summarize_python(columns, churn_times, today, now, weeks):
+    def column(name):
+        weights = columns.get(name + '_weights')
+        return columns[name], weights if weights is not None else itertools.repeat(1)
+
+    plan, plan_weights = column('plan')
+    expiry, expiry_weights = column('expiry')
+    created, created_weights = column('created')
+    plans = [0] * len(PLANS)
+    for code, weight in zip(plan, plan_weights):
+        plans[code] += weight
+    return {
+        'total': sum(plans),
+        'plans': plans,
+        'expired': sum(weight for value, weight in zip(expiry, expiry_weights) if value < today),
+        'expiring': _weekly_python(expiry, expiry_weights, today, weeks, 7),
+        'registered': _weekly_python((now - value for value in created), created_weights, 0, weeks, WEEK),
+        'unregistered': _weekly_python((now - value for value in churn_times), itertools.repeat(1), 0, weeks, WEEK),
+    }
+
+def summarize(columns, churn_times, weeks=8, today=None, now=None):
+    # 플랜별 유저 수, 주별 만료 예정 수, 주별 가입/탈퇴 수와 최근 4주 이탈률을 계산함
+    # expiring[0] 은 오늘부터 7일 안, registered[0] 과 unregistered[0] 은 지난 7일
+    today = today or date.today().toordinal()
+    now = int(now or time.time())
+    summarize_columns = _summarize_numpy if np is not None else _summarize_python
+    stats = summarize_columns(columns, churn_times, today, now, weeks)
+    stats['licensed'] = columns['licensed']
+    # 4주 전에 있던 유저 중 몇 명이 탈퇴했는지, 4주 전 유저 수는 지금 수에서 그동안 가입한 수를 빼고 탈퇴한 수를 더해서 구함
+    joined = sum(stats['registered'][:4])
+    left = sum(stats['unregistered'][:4])
+    start = stats['total'] - joined + left
+    stats['churn_rate'] = left / start if start > 0 else 0.0
+    stats['plans'] = dict(zip(PLANS, stats['plans']))
+    return stats
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from array import array
+from datetime import date, timedelta
+
+from analytics import summarize
+from licenses import generate_keys
+from storage import UserStore, SqliteStore, NameCache, KeyPool, CachedFile, USER_FIELDS, BAN_FIELDS
+
+# 스토리지와 명령어 처리 속도를 재는 스크립트
+# python bench.py --sizes 1000 100000 --backends csv journal sqlite --commands
+# --commands 는 discord.py 가 설치되어 있어야 하고 newbot 의 명령어 콜백을 가짜 Interaction 으로 직접 부름
+
+PLANS = ['free', 'standard', 'deluxe', 'premium']
+USER_ID_BASE = 10 ** 17
+
+def make_dataset(directory, size, seed=0):
+    # users.csv, banlist.csv (10%), config.json 을 만들고 (유저 아이디, 라이센스, 라이센스 없는 유저) 목록을 돌려줌
+    rng = random.Random(seed)
+    keys = generate_keys(size)
+    today = date.today()
+    now = int(time.time())
+    user_ids = []
+    licenses = []
+    unlicensed = []
+    with open(os.path.join(directory, 'users.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=USER_FIELDS)
+        writer.writeheader()
+        for i in range(size):
+            user_id = USER_ID_BASE + i
+            user_ids.append(user_id)
+            if rng.random() < 0.1:
+                unlicensed.append(user_id)
+                writer.writerow({'user_id': user_id, 'username': f'user{i}', 'license': '', 'plan': 'None', 'expiry_date': '', 'created': now - rng.randint(0, 365 * 86400)})
+                continue
+            licenses.append(keys[i])
+            expiry_date = today + timedelta(days=rng.randint(1, 730))
+            writer.writerow({'user_id': user_id, 'username': f'user{i}', 'license': keys[i], 'plan': rng.choice(PLANS), 'expiry_date': expiry_date.isoformat(), 'created': now - rng.randint(0, 365 * 86400)})
+    with open(os.path.join(directory, 'banlist.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=BAN_FIELDS)
+        writer.writeheader()
+        for user_id in rng.sample(user_ids, size // 10):
+            writer.writerow({'user_id': user_id, 'reason': '벤치마크'})
+    with open(os.path.join(directory, 'config.json'), 'w') as f:
+        json.dump({'admins': [user_ids[0]]}, f, indent=4)
+    return user_ids, licenses, unlicensed
+
+def make_store(backend, directory):
+    users_csv = os.path.join(directory, 'users.csv')
+    banlist_csv = os.path.join(directory, 'banlist.csv')
+    if backend == 'sqlite':
+        return SqliteStore(os.path.join(directory, 'license.db'), users_csv=users_csv, banlist_csv=banlist_csv)
+    journal_file = os.path.join(directory, 'users.journal') if backend == 'journal' else None
+    return UserStore(users_csv, banlist_csv, 3600, journal_file, 1 << 40)
+
+class Timings:
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+
+    def report(self):
+        samples = sorted(self.samples)
+        total = sum(samples)
+        def pct(q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+        ops = len(samples) / total if total else float('inf')
+        print(f"  {self.name:28} {len(samples):>7}회 {total:9.3f}초 {ops:>12,.0f}/초  p50 {pct(0.5):>9.1f}µs  p99 {pct(0.99):>9.1f}µs")
+
+async def measure(name, func, args_list):
+    timings = Timings(name)
+    for args in args_list:
+        start = time.perf_counter()
+        await func(*args)
+        timings.samples.append(time.perf_counter() - start)
+    timings.report()
+
+async def measure_once(name, func, *args):
+    await measure(name, func, [args])
+
+async def bench_storage(backend, directory, user_ids, licenses, samples, rng):
+    store = make_store(backend, directory)
+    await measure_once('load', store.load)
+    ids = [(rng.choice(user_ids),) for _ in range(samples)]
+    await measure('get', store.get, ids)
+    await measure('is_banned', store.is_banned, ids)
+    await measure('lookup', store.lookup, ids)
+    await measure('find_by_license', store.find_by_license, [(rng.choice(licenses),) for _ in range(samples)])
+    await measure('page_users', store.page_users, [(rng.randrange(len(user_ids)), 21) for _ in range(min(samples, 200))])
+    await measure('page_users(plan)', store.page_users, [(0, 21, rng.choice(PLANS)) for _ in range(min(samples, 200))])
+    await measure_once('user_columns', store.user_columns)
+    columns = await store.user_columns()
+    async def analyze():
+        summarize(columns, array('q'))
+    await measure_once('summarize', analyze)
+
+    async def update(user_id):
+        await store.update(user_id, plan=rng.choice(PLANS))
+    await measure('update', update, ids)
+    if hasattr(store, 'flush'):
+        await measure_once('flush (save_users)', store.flush)
+    await store.close()
+
+async def bench_licenses(samples):
+    async def single():
+        generate_keys(1)
+    await measure('generate_license', single, [()] * samples)
+    async def batch(count):
+        generate_keys(count)
+    await measure_once('generate_keys(10000)', batch, 10000)
+
+async def bench_commands(backend, directory, user_ids, unlicensed, samples, rng):
+    # newbot 을 불러오면 client 가 만들어지기만 하고 실행되지는 않음
+    import discord
+    import newbot
+
+    class FakeUser:
+        def __init__(self, user_id):
+            self.id = user_id
+            self.name = f'user{user_id - USER_ID_BASE}'
+            self.avatar = None
+
+    class FakeResponse:
+        def __init__(self):
+            self.sent = []
+            self.done = False
+
+        def is_done(self):
+            return self.done
+
+        async def send_message(self, *args, **kwargs):
+            self.sent.append(kwargs)
+            self.done = True
+
+        async def edit_message(self, **kwargs):
+            self.sent.append(kwargs)
+            self.done = True
+
+        async def defer(self, **kwargs):
+            self.done = True
+
+        async def send_modal(self, modal):
+            self.sent.append({'modal': modal})
+            self.done = True
+
+    class FakeFollowup:
+        async def send(self, *args, **kwargs):
+            pass
+
+    class FakeInteraction(discord.Interaction):
+        # access_check 의 isinstance 검사를 통과하도록 discord.Interaction 을 상속하고 필요한 것만 채움
+        user = None
+        guild = None
+        response = None
+        followup = None
+        extras = None
+        client = None
+
+        def __init__(self, user_id):
+            self.user = FakeUser(user_id)
+            self.guild = None
+            self.response = FakeResponse()
+            self.followup = FakeFollowup()
+            self.extras = {}
+            self.client = newbot.client
+
+    client = newbot.client
+    client.store = make_store(backend, directory)
+    client.config_file = os.path.join(directory, 'config.json')
+    client.config_cache = CachedFile(client.config_file, newbot.parse_config)
+    client.name_cache = NameCache(os.path.join(directory, 'names.json'))
+    client.key_pool = KeyPool(os.path.join(directory, 'license_pool.txt'))
+    await client.store.load()
+    await newbot.load_config()
+    client.expiry = newbot.ExpiryScheduler(client.store, client.expiry_action)
+    admin_id = user_ids[0]
+    # 차단 목록 닉네임을 API 로 가져오지 않게 앞부분은 캐시에 넣어둠
+    count = 0
+    async for user_id, _ in client.store.iter_banlist():
+        client.name_cache.put(user_id, f'user{user_id - USER_ID_BASE}')
+        count += 1
+        if count >= 1000:
+            break
+
+    async def run(command, user_id, *args):
+        await command.callback(FakeInteraction(user_id), *args)
+
+    ids = [(rng.choice(user_ids),) for _ in range(samples)]
+    await measure('/정보', lambda user_id: run(newbot.my_info, user_id), ids)
+    await measure('/생성', lambda user_id: run(newbot.create_license, user_id), [(user_id,) for user_id in unlicensed[:samples]])
+    for option in ('licenses', 'users', 'banned'):
+        await measure(f'/목록 {option}', lambda: run(newbot.list_info, admin_id, option, None, None), [()] * min(samples, 200))
+
+    async def next_pages(pages):
+        interaction = FakeInteraction(admin_id)
+        await newbot.list_info.callback(interaction, 'users', None, None)
+        view = interaction.response.sent[0]['view']
+        for page in range(1, pages):
+            view.page = page
+            await view.render()
+    await measure_once('/목록 users 50페이지', next_pages, 50)
+
+    async def manage(user_id):
+        await run(newbot.manage_user, admin_id, FakeUser(user_id), 'plan_premium', None)
+    await measure('/관리 plan_premium', manage, ids)
+    await client.store.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description="스토리지와 명령어 처리 속도를 측정합니다.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000], help="유저 수 (예: 1000 100000 1000000)")
+    parser.add_argument('--backends', nargs='+', default=['csv', 'journal', 'sqlite'], choices=['csv', 'journal', 'sqlite'])
+    parser.add_argument('--samples', type=int, default=2000, help="작업마다 반복할 횟수")
+    parser.add_argument('--commands', action='store_true', help="newbot 명령어도 측정 (discord.py 필요)")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    print("라이센스 생성")
+    await bench_licenses(args.samples)
+    for size in args.sizes:
+        base = tempfile.mkdtemp(prefix='bench-')
+        try:
+            start = time.perf_counter()
+            user_ids, licenses, unlicensed = make_dataset(base, size)
+            print(f"\n유저 {size:,}명 (데이터 생성 {time.perf_counter() - start:.1f}초)")
+            # 백엔드마다 같은 원본 파일에서 시작함
+            ignore = shutil.ignore_patterns(*args.backends, '*-commands')
+            for backend in args.backends:
+                directory = os.path.join(base, backend)
+                shutil.copytree(base, directory, ignore=ignore)
+                print(f"[{backend}]")
+                await bench_storage(backend, directory, user_ids, licenses, args.samples, rng)
+                if args.commands:
+                    directory = os.path.join(base, backend + '-commands')
+                    shutil.copytree(base, directory, ignore=ignore)
+                    await bench_commands(backend, directory, user_ids, unlicensed, args.samples, rng)
+        finally:
+            shutil.rmtree(base)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -4,6 +4,9 @@ import json
 import random
 import string
 import os
+import itertools
+from treesync import sync_tree
+from storage import atomic_write, CachedFile
 
 class MyClient(discord.Client):
     def __init__(self):
@@ -14,31 +17,55 @@ class MyClient(discord.Client):
         self.tree = app_commands.CommandTree(self)
         self.admin_id = 1238461591557771355 # 본인 아이디 넣으셈
         self.config_file = r'config.json' # 콘픽 경로 복사한 다음 config.json 지우고 붙여넣기 ㄱㄱ
+        self.config_cache = CachedFile(self.config_file, parse_config) # 파일이 바뀌었을 때만 다시 읽음 (손으로 고쳐도 바로 반영됨)
+        self.license_index = {} # 라이센스 -> user_id
+        self.commands_hash_file = r'commands.json' # 명령어가 바뀌었을 때만 sync 하려고 저장하는 해시
+        self.dev_guild_id = None # 개발용 서버 아이디, 넣으면 그 서버에만 명령어를 바로 등록함
 
     async def setup_hook(self):
-        await self.tree.sync()
+        await sync_tree(self.tree, self.commands_hash_file, self.dev_guild_id)
+
+# 파일에는 리스트로 저장하고 메모리에서는 set, 라이센스는 user_id 로 찾는 dict 로 들고 있음
+ID_SET_KEYS = ["banned_users", "admins", "registered_users"]
+
+def parse_config(f):
+    data = json.load(f)
+    config = {"licenses": {lic["user_id"]: lic for lic in data.get("licenses", [])}}
+    for key in ID_SET_KEYS:
+        config[key] = set(data.get(key, []))
+    return config
 
 client = MyClient()
 
 def load_config():
+    # 파일의 mtime, 크기, inode 가 그대로면 전에 읽은 것을 사용하고, 바뀌었을 때만 다시 읽음
+    cache = client.config_cache
+    if not cache.changed():
+        return cache.data
     if os.path.exists(client.config_file):
         try:
-            with open(client.config_file, 'r') as f:
-                return json.load(f)
+            config = cache.reload()
         except json.JSONDecodeError:
+            if cache.loaded:
+                print("JSON 파일이 잘못된 형식입니다. 이전 설정을 그대로 사용합니다.")
+                return cache.data
             print("JSON 파일이 잘못된 형식입니다. 기본값을 사용합니다.")
             return initialize_config()
+        client.license_index = {lic["license"]: lic["user_id"] for lic in config["licenses"].values()}
+        return config
     else:
         return initialize_config()
 
 def initialize_config():
-    config = {"licenses": [], "banned_users": [], "admins": [], "registered_users": []}
+    config = {"licenses": {}, "banned_users": set(), "admins": set(), "registered_users": set()}
     save_config(config)
     return config
 
 def save_config(config):
-    with open(client.config_file, 'w') as f:
-        json.dump(config, f, indent=4)
+    data = {"licenses": list(config["licenses"].values())}
+    for key in ID_SET_KEYS:
+        data[key] = sorted(config[key])
+    atomic_write(client.config_file, lambda f: json.dump(data, f, indent=4))
 
 def is_admin(user_id):
     config = load_config()
@@ -53,8 +80,12 @@ def is_registered(user_id):
     return user_id in config["registered_users"]
 
 def generate_license():
-    chars = ''.join(random.choices(string.ascii_uppercase + string.digits, k=16))
-    return '-'.join([chars[i:i+4] for i in range(0, 16, 4)])
+    # 이미 있는 라이센스와 겹치면 다시 만듦
+    while True:
+        chars = ''.join(random.choices(string.ascii_uppercase + string.digits, k=16))
+        license = '-'.join([chars[i:i+4] for i in range(0, 16, 4)])
+        if license not in client.license_index:
+            return license
 
 @client.event
 async def on_ready():
@@ -71,14 +102,14 @@ async def manage_admin(interaction: discord.Interaction, action: str, user: disc
         config = load_config()
         if action == "add":
             if user.id not in config["admins"]:
-                config["admins"].append(user.id)
+                config["admins"].add(user.id)
                 save_config(config)
                 await interaction.response.send_message(f"{user.name}을 총관리자로 추가했습니다.")
             else:
                 await interaction.response.send_message(f"{user.name}은 이미 총관리자입니다.")
         elif action == "remove":
             if user.id in config["admins"]:
-                config["admins"].remove(user.id)
+                config["admins"].discard(user.id)
                 save_config(config)
                 await interaction.response.send_message(f"{user.name}을 총관리자에서 삭제했습니다.")
             else:
@@ -99,14 +130,14 @@ async def manage_ban(interaction: discord.Interaction, action: str, user: discor
         config = load_config()
         if action == "add":
             if user.id not in config["banned_users"]:
-                config["banned_users"].append(user.id)
+                config["banned_users"].add(user.id)
                 save_config(config)
                 await interaction.response.send_message(f"{user.name}을 차단했습니다.")
             else:
                 await interaction.response.send_message(f"{user.name}은 이미 차단된 사용자입니다.")
         elif action == "remove":
             if user.id in config["banned_users"]:
-                config["banned_users"].remove(user.id)
+                config["banned_users"].discard(user.id)
                 save_config(config)
                 await interaction.response.send_message(f"{user.name}의 차단을 해제했습니다.")
             else:
@@ -127,7 +158,7 @@ async def register(interaction: discord.Interaction):
         return
 
     config = load_config()
-    config["registered_users"].append(interaction.user.id)
+    config["registered_users"].add(interaction.user.id)
     save_config(config)
     await interaction.response.send_message("가입이 완료되었습니다. 이제 명령어를 사용할 수 있습니다.")
 
@@ -142,8 +173,10 @@ async def unregister(interaction: discord.Interaction):
         return
 
     config = load_config()
-    config["registered_users"].remove(interaction.user.id)
-    config["licenses"] = [lic for lic in config["licenses"] if lic["user_id"] != interaction.user.id]
+    config["registered_users"].discard(interaction.user.id)
+    license_info = config["licenses"].pop(interaction.user.id, None)
+    if license_info is not None:
+        client.license_index.pop(license_info["license"], None)
     save_config(config)
     await interaction.response.send_message("탈퇴가 완료되었습니다. 모든 라이센스가 삭제되었습니다.")
 
@@ -158,7 +191,7 @@ async def create_license(interaction: discord.Interaction):
         return
 
     config = load_config()
-    if any(lic['user_id'] == interaction.user.id for lic in config["licenses"]):
+    if interaction.user.id in config["licenses"]:
         await interaction.response.send_message("각 사용자는 하나의 라이센스만 가질 수 있습니다.")
         return
 
@@ -169,11 +202,56 @@ async def create_license(interaction: discord.Interaction):
         "license": license
     }
     
-    config["licenses"].append(license_info)
+    config["licenses"][interaction.user.id] = license_info
+    client.license_index[license] = interaction.user.id
     save_config(config)
     
     await interaction.response.send_message(f"새로운 라이센스가 생성되었습니다: {license}")
 
+@client.tree.command(name="조회", description="라이센스 키의 주인을 확인합니다.")
+@app_commands.describe(license="확인할 라이센스 키")
+async def lookup_license(interaction: discord.Interaction, license: str):
+    if not (is_admin(interaction.user.id) or interaction.user.id == client.admin_id):
+        await interaction.response.send_message("당신은 이 명령어를 사용할 권한이 없습니다.")
+        return
+
+    config = load_config()
+    user_id = client.license_index.get(license.strip().upper())
+    if user_id is None:
+        await interaction.response.send_message("해당 라이센스를 가진 유저가 없습니다.")
+        return
+
+    license_info = config["licenses"][user_id]
+    await interaction.response.send_message(f"라이센스 {license_info['license']} 의 주인: {license_info['username']} ({user_id})")
+
+class ListView(discord.ui.View):
+    # 목록을 한 페이지씩만 만들어서 보여줌
+    def __init__(self, title, items, format_item, page_size=30):
+        super().__init__(timeout=300)
+        self.title = title
+        self.items = items
+        self.format_item = format_item
+        self.page_size = page_size
+        self.page = 0
+
+    def render(self):
+        start = self.page * self.page_size
+        rows = list(itertools.islice(self.items, start, start + self.page_size + 1))
+        self.prev_button.disabled = self.page == 0
+        self.next_button.disabled = len(rows) <= self.page_size
+        lines = "\n".join(self.format_item(item) for item in rows[:self.page_size])
+        return f"{self.title} ({self.page + 1} 페이지):\n{lines}"[:2000]
+
+    @discord.ui.button(label="이전", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="다음", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(content=self.render(), view=self)
+
 @client.tree.command(name="목록", description="라이센스, 유저, 차단, 총관리자 목록을 표시합니다.")
 @app_commands.describe(option="표시할 목록의 종류")
 @app_commands.choices(option=[
@@ -194,22 +272,30 @@ async def list_info(interaction: discord.Interaction, option: str):
     config = load_config()
 
     if option == "licenses":
-        licenses = config.get("licenses", [])
+        licenses = config["licenses"]
         if licenses:
-            license_list = "\n".join([f"사용자: {lic['username']}, 라이센스: {lic['license']}" for lic in licenses])
-            await interaction.response.send_message(f"라이센스 목록:\n{license_list}")
+            view = ListView("라이센스 목록", licenses.values(), lambda lic: f"사용자: {lic['username']}, 라이센스: {lic['license']}")
+            await interaction.response.send_message(view.render(), view=view)
         else:
             await interaction.response.send_message("생성된 라이센스가 없습니다.")
     
     elif option == "users":
-        registered_users = [interaction.guild.get_member(user_id) for user_id in config.get("registered_users", [])]
-        user_list = "\n".join([user.name for user in registered_users if user is not None])
-        await interaction.response.send_message(f"가입된 유저 목록:\n{user_list}" if user_list else "가입된 유저가 없습니다.")
+        registered_users = (interaction.guild.get_member(user_id) for user_id in config["registered_users"])
+        registered_users = [user for user in registered_users if user is not None]
+        if registered_users:
+            view = ListView("가입된 유저 목록", registered_users, lambda user: user.name)
+            await interaction.response.send_message(view.render(), view=view)
+        else:
+            await interaction.response.send_message("가입된 유저가 없습니다.")
 
     elif option == "banned":
-        banned_users = [interaction.guild.get_member(user_id) for user_id in config.get("banned_users", [])]
-        banned_list = "\n".join([user.name for user in banned_users if user is not None])
-        await interaction.response.send_message(f"차단된 유저 목록:\n{banned_list}" if banned_list else "차단된 유저가 없습니다.")
+        banned_users = (interaction.guild.get_member(user_id) for user_id in config["banned_users"])
+        banned_users = [user for user in banned_users if user is not None]
+        if banned_users:
+            view = ListView("차단된 유저 목록", banned_users, lambda user: user.name)
+            await interaction.response.send_message(view.render(), view=view)
+        else:
+            await interaction.response.send_message("차단된 유저가 없습니다.")
 
     elif option == "admins":
         admin_users = [interaction.guild.get_member(user_id) for user_id in config.get("admins", [])]
@@ -8,6 +8,15 @@ import os
 from datetime import datetime, timedelta
 from discord.ui import Button, View
 import asyncio
+from treesync import sync_tree
+from storage import atomic_write, CachedFile, UserRecord
+
+USER_FIELDS = ['user_id', 'username', 'banned', 'license', 'plan', 'expiry_date']
+
+def read_users(f):
+    # 캐시에는 문자열 dict 대신 UserRecord 로 들고 있음
+    records = (UserRecord.from_row(row) for row in csv.DictReader(f))
+    return {record.user_id: record for record in records}
 
 class MyClient(discord.Client):
     def __init__(self):
@@ -19,17 +28,22 @@ class MyClient(discord.Client):
         self.admin_id = 아이디
         self.config_file = r'콘픽'
         self.users_csv = r'csv'
+        self.config_cache = CachedFile(self.config_file, json.load) # 파일의 mtime, 크기, inode 가 바뀌었을 때만 다시 읽음
+        self.users_cache = CachedFile(self.users_csv, read_users, newline='')
+        self.commands_hash_file = r'commands.json' # 명령어가 바뀌었을 때만 sync 하려고 저장하는 해시
+        self.dev_guild_id = None # 개발용 서버 아이디, 넣으면 그 서버에만 명령어를 바로 등록함
         
     async def setup_hook(self):
-        await self.tree.sync()
+        await sync_tree(self.tree, self.commands_hash_file, self.dev_guild_id)
 
 client = MyClient()
 
 def load_config():
     if os.path.exists(client.config_file):
         try:
-            with open(client.config_file, 'r') as f:
-                return json.load(f)
+            # 부르는 쪽에서 고쳐도 캐시가 바뀌지 않게 복사해서 줌
+            config = client.config_cache.get()
+            return dict(config, admins=list(config.get("admins", [])))
         except json.JSONDecodeError:
             print("JSON 파일이 잘못된 형식입니다. 기본값을 사용합니다.")
             return initialize_config()
@@ -42,33 +56,34 @@ def initialize_config():
     return config
 
 def save_config(config):
-    with open(client.config_file, 'w') as f:
-        json.dump(config, f, indent=4)
+    atomic_write(client.config_file, lambda f: json.dump(config, f, indent=4))
 
 def load_users():
     if os.path.exists(client.users_csv):
-        users = {}
-        with open(client.users_csv, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                users[int(row['user_id'])] = row
-        return users
+        return {user_id: record.to_row(USER_FIELDS) for user_id, record in client.users_cache.get().items()}
+    return {}
+
+def load_records():
+    # 읽기만 할 때는 복사하지 않고 캐시에 있는 UserRecord 를 그대로 씀
+    if os.path.exists(client.users_csv):
+        return client.users_cache.get()
     return {}
 
 def save_users(users):
-    with open(client.users_csv, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=['user_id', 'username', 'banned', 'license', 'plan', 'expiry_date'])
+    def write(f):
+        writer = csv.DictWriter(f, fieldnames=USER_FIELDS)
         writer.writeheader()
         for user_id, user_info in users.items():
             writer.writerow(user_info)
+    atomic_write(client.users_csv, write, newline='')
 
 def is_admin(user_id):
     config = load_config()
     return user_id in config["admins"]
 
 def is_banned(user_id):
-    users = load_users()
-    return users.get(user_id, {}).get('banned') == 'True'
+    record = load_records().get(user_id)
+    return record is not None and record.banned
 
 def get_user_info(user_id):
     users = load_users()
@@ -252,22 +267,22 @@ async def list_info_function(interaction: discord.Interaction, option: str):
         await interaction.response.send_message("당신은 이 명령어를 사용할 권한이 없습니다.")
         return
 
-    users = load_users()
+    users = load_records()
 
     if option == "라이센스":
-        licenses = [info for info in users.values() if info.get('license')]
+        licenses = [record for record in users.values() if record.license]
         if licenses:
-            license_list = "\n".join([f"사용자: {info['username']}, 라이센스: {info['license']}" for info in licenses])
+            license_list = "\n".join([f"사용자: {record.username}, 라이센스: {record.license}" for record in licenses])
             await interaction.response.send_message(f"라이센스 목록:\n{license_list}", ephemeral=True)
         else:
             await interaction.response.send_message("생성된 라이센스가 없습니다.", ephemeral=True)
     
     elif option == "유저":
-        user_list = "\n".join([info['username'] for info in users.values()])
+        user_list = "\n".join([record.username for record in users.values()])
         await interaction.response.send_message(f"가입된 유저 목록:\n{user_list}" if user_list else "가입된 유저가 없습니다.", ephemeral=True)
 
     elif option == "차단":
-        banned_users = [info['username'] for info in users.values() if info.get('banned') == 'True']
+        banned_users = [record.username for record in users.values() if record.banned]
         banned_list = "\n".join(banned_users)
         await interaction.response.send_message(f"차단된 유저 목록:\n{banned_list}" if banned_list else "차단된 유저가 없습니다.", ephemeral=True)
 
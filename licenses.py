@@ -0,0 +1,259 @@
+import argparse
+import base64
+import csv
+import hashlib
+import hmac
+import math
+import mmap
+import os
+import secrets
+import string
+import struct
+import sys
+import time
+from bisect import bisect_left
+from datetime import date
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+except ImportError:
+    Ed25519PrivateKey = None
+
+LICENSE_CHARS = string.ascii_uppercase + string.digits
+# 0~251 만 쓰면 36 으로 나눈 나머지가 고르게 나옴, 252~255 는 버림
+_USABLE = 256 - 256 % len(LICENSE_CHARS)
+_TRANSLATE = bytes(ord(LICENSE_CHARS[b % len(LICENSE_CHARS)]) for b in range(256))
+_DELETE = bytes(range(_USABLE, 256))
+
+def format_license(chars):
+    return '-'.join([chars[i:i+4] for i in range(0, 16, 4)])
+
+def generate_keys(count, exclude=()):
+    # secrets 로 한 번에 필요한 만큼 랜덤 바이트를 만들어서 count 개의 중복 없는 키를 만듦
+    keys = set()
+    while len(keys) < count:
+        need = count - len(keys)
+        data = secrets.token_bytes(need * 16 * 256 // _USABLE + 64)
+        chars = data.translate(_TRANSLATE, _DELETE).decode('ascii')
+        for i in range(0, len(chars) - 15, 16):
+            key = format_license(chars[i:i+16])
+            if key not in exclude:
+                keys.add(key)
+                if len(keys) >= count:
+                    break
+    return list(keys)
+
+# 서명 라이센스: 버전, 일련번호, user_id, 플랜, 만료일(1970-01-01 부터 일수, 0 은 없음) 뒤에 서명을 붙여서 base32 로 만듦
+SIGNED_HMAC = 1
+SIGNED_ED25519 = 2
+PLANS = ['None', 'free', 'standard', 'deluxe', 'premium']
+PLAN_CODES = {plan: code for code, plan in enumerate(PLANS)}
+_PAYLOAD = struct.Struct('>BQQBH')
+_HMAC_SIZE = 15
+_ED25519_SIZE = 64
+_EPOCH = date(1970, 1, 1).toordinal()
+
+def is_signed_license(key):
+    # 기존 랜덤 키는 XXXX-XXXX-XXXX-XXXX 19글자라서 길이로 구분함
+    return len(key) > 19
+
+class LicenseSigner:
+    # secret 이 있으면 HMAC, private_key_file 이 있으면 Ed25519 로 서명함
+    # 클라이언트에 넣을 때는 HMAC 은 secret 이 그대로 노출되니까 public_key_file 만 쓰는 Ed25519 를 쓰는게 좋음
+    def __init__(self, secret=None, private_key_file=None, public_key_file=None):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.private_key = None
+        self.public_key = None
+        if private_key_file or public_key_file:
+            if Ed25519PrivateKey is None:
+                raise RuntimeError("Ed25519 서명을 쓰려면 cryptography 패키지가 필요합니다.")
+            if private_key_file:
+                with open(private_key_file, 'rb') as f:
+                    self.private_key = serialization.load_pem_private_key(f.read(), password=None)
+                self.public_key = self.private_key.public_key()
+            else:
+                with open(public_key_file, 'rb') as f:
+                    self.public_key = serialization.load_pem_public_key(f.read())
+
+    def sign(self, user_id, plan, expiry_date, serial=None):
+        if serial is None:
+            serial = secrets.randbits(64)
+        days = date.fromisoformat(expiry_date).toordinal() - _EPOCH if expiry_date else 0
+        if self.private_key is not None:
+            payload = _PAYLOAD.pack(SIGNED_ED25519, serial, int(user_id), PLAN_CODES[plan], days)
+            data = payload + self.private_key.sign(payload)
+        elif self.secret:
+            payload = _PAYLOAD.pack(SIGNED_HMAC, serial, int(user_id), PLAN_CODES[plan], days)
+            data = payload + hmac.digest(self.secret, payload, hashlib.sha256)[:_HMAC_SIZE]
+        else:
+            raise RuntimeError("서명에 쓸 secret 이나 private_key_file 이 없습니다.")
+        chars = base64.b32encode(data).decode('ascii').rstrip('=')
+        return '-'.join([chars[i:i+8] for i in range(0, len(chars), 8)])
+
+    def verify(self, key):
+        # 서명이 맞으면 들어있는 정보를 돌려주고, 틀리거나 형식이 잘못되면 None
+        # 만료일과 폐기 목록 확인은 부르는 쪽에서 함
+        chars = key.replace('-', '').upper()
+        try:
+            data = base64.b32decode(chars + '=' * (-len(chars) % 8))
+        except ValueError:
+            return None
+        if len(data) < _PAYLOAD.size:
+            return None
+        payload, signature = data[:_PAYLOAD.size], data[_PAYLOAD.size:]
+        version, serial, user_id, plan_code, days = _PAYLOAD.unpack(payload)
+        if version == SIGNED_HMAC and len(signature) == _HMAC_SIZE and self.secret:
+            if not hmac.compare_digest(signature, hmac.digest(self.secret, payload, hashlib.sha256)[:_HMAC_SIZE]):
+                return None
+        elif version == SIGNED_ED25519 and len(signature) == _ED25519_SIZE and self.public_key is not None:
+            try:
+                self.public_key.verify(signature, payload)
+            except Exception:
+                return None
+        else:
+            return None
+        if plan_code >= len(PLANS):
+            return None
+        return {
+            'serial': serial,
+            'user_id': user_id,
+            'plan': PLANS[plan_code],
+            'expiry_date': date.fromordinal(days + _EPOCH).isoformat() if days else None
+        }
+
+def license_id(key):
+    # 폐기 목록에 넣는 64비트 번호, 서명 라이센스는 키에 들어있는 일련번호, 랜덤 키는 blake2b 해시
+    chars = key.strip().upper().replace('-', '')
+    if is_signed_license(key):
+        try:
+            return struct.unpack_from('>Q', base64.b32decode(chars[:32]), 1)[0]
+        except (ValueError, struct.error):
+            pass
+    return int.from_bytes(hashlib.blake2b(chars.encode(), digest_size=8).digest(), 'little')
+
+class BloomFilter:
+    # 폐기 목록 앞에 두는 Bloom 필터, 없다고 나오면 정렬된 배열은 볼 필요 없음
+    # 위치는 blake2b(값, 16바이트) 를 h1, h2 로 나눠서 (h1 + i * h2) % size 로 구함
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray(size // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.001):
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 64) * 64
+        return cls(size, max(1, round(size / capacity * math.log(2))))
+
+    def _positions(self, value):
+        h1, h2 = struct.unpack('<QQ', hashlib.blake2b(value.to_bytes(8, 'little'), digest_size=16).digest())
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+# 폐기 목록 파일 (리틀 엔디안): 헤더 'RVK1', 해시 개수(u32), 필터 비트 수(u64), 번호 개수(u64)
+# 다음에 Bloom 필터 비트, 그 다음에 정렬된 u64 번호 배열
+REVOCATION_MAGIC = b'RVK1'
+_REVOCATION_HEADER = struct.Struct('<4sIQQ')
+
+def write_revocation_file(path, bloom, ids):
+    # 여러 프로세스가 동시에 써도 임시 파일이 겹치지 않게 프로세스마다 다른 이름을 씀
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_REVOCATION_HEADER.pack(REVOCATION_MAGIC, bloom.hashes, bloom.size, len(ids)))
+        f.write(bloom.bits)
+        if sys.byteorder == 'big':
+            ids = ids[:]
+            ids.byteswap()
+        f.write(ids.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class RevocationFile:
+    # 외부 확인 프로그램용, 파일을 mmap 해서 CSV 없이 바로 폐기 여부를 확인함
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, hashes, size, count = _REVOCATION_HEADER.unpack_from(self.mmap)
+        if magic != REVOCATION_MAGIC:
+            raise ValueError("폐기 목록 파일이 아닙니다.")
+        view = memoryview(self.mmap)
+        start = _REVOCATION_HEADER.size
+        self.bloom = BloomFilter(size, hashes, view[start:start + size // 8])
+        start += size // 8
+        self.ids = view[start:start + count * 8].cast('Q') # 리틀 엔디안 기계 기준
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, value):
+        if value not in self.bloom:
+            return False
+        i = bisect_left(self.ids, value)
+        return i < len(self.ids) and self.ids[i] == value
+
+    def is_revoked(self, key):
+        return license_id(key) in self
+
+    def close(self):
+        self.bloom.bits.release()
+        self.ids.release()
+        self.mmap.close()
+
+def benchmark(count):
+    signers = {'HMAC': LicenseSigner(secret=secrets.token_bytes(32))}
+    if Ed25519PrivateKey is not None:
+        signer = LicenseSigner()
+        signer.private_key = Ed25519PrivateKey.generate()
+        signer.public_key = signer.private_key.public_key()
+        signers['Ed25519'] = signer
+    else:
+        print("cryptography 패키지가 없어서 Ed25519 는 건너뜁니다.")
+
+    start = time.perf_counter()
+    generate_keys(count)
+    elapsed = time.perf_counter() - start
+    print(f"랜덤 키   생성 {count}개: {elapsed:.3f}초 ({count / elapsed:,.0f}개/초)")
+    for name, signer in signers.items():
+        start = time.perf_counter()
+        keys = [signer.sign(user_id, 'premium', '2030-12-31') for user_id in range(count)]
+        elapsed = time.perf_counter() - start
+        print(f"{name:8} 서명 {count}개: {elapsed:.3f}초 ({count / elapsed:,.0f}개/초, 키 길이 {len(keys[0])})")
+        start = time.perf_counter()
+        valid = sum(1 for key in keys if signer.verify(key) is not None)
+        elapsed = time.perf_counter() - start
+        print(f"{name:8} 검증 {count}개: {elapsed:.3f}초 ({count / elapsed:,.0f}개/초, 통과 {valid}개)")
+
+def main():
+    parser = argparse.ArgumentParser(description="라이센스 키를 대량으로 만들어서 키 풀 파일에 추가합니다. 봇이 켜져 있으면 다시 켜야 반영됩니다.")
+    parser.add_argument('count', type=int, help="만들 키 개수")
+    parser.add_argument('--pool', default='license_pool.txt', help="키 풀 파일")
+    parser.add_argument('--users', default='users.csv', help="이미 발급된 키를 확인할 users.csv")
+    parser.add_argument('--bench', action='store_true', help="키를 저장하지 않고 COUNT 개로 생성/서명/검증 속도만 측정")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.count)
+        return
+
+    exclude = set()
+    if os.path.exists(args.pool):
+        with open(args.pool, 'r') as f:
+            exclude.update(line.strip().lstrip('-') for line in f)
+    if os.path.exists(args.users):
+        with open(args.users, 'r') as f:
+            exclude.update(row['license'] for row in csv.DictReader(f) if row.get('license'))
+
+    keys = generate_keys(args.count, exclude)
+    with open(args.pool, 'a') as f:
+        f.write(''.join(key + '\n' for key in keys))
+    print(f"{len(keys)}개의 키를 {args.pool} 에 추가했습니다.")
+
+if __name__ == '__main__':
+    main()
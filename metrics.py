@@ -0,0 +1,93 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+# 지연 시간 히스토그램 구간 (초), 마지막은 그보다 큰 값 전부
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        # 구간 안에서는 값이 고르게 퍼져있다고 보고 추정함
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if self.buckets[i] != float('inf') else lower * 2 or 1.0
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+class Metrics:
+    # 명령어/버튼 지연 시간, 저장소 I/O, 디스코드 REST 요청 수를 모아둠
+    def __init__(self):
+        self.latency = defaultdict(Histogram) # 이름 -> Histogram
+        self.counters = defaultdict(int) # (이름, 라벨) -> 값
+        self.started = time.time()
+        self._lock = threading.Lock() # 저장소 스레드에서도 올리니까 잠금
+
+    def observe(self, name, seconds):
+        self.latency[name].observe(seconds)
+
+    def inc(self, name, label='', value=1):
+        with self._lock:
+            self.counters[name, label] += value
+
+    def counter_items(self, name):
+        with self._lock:
+            items = [(label, value) for (counter, label), value in self.counters.items() if counter == name]
+        return sorted(items, key=lambda item: -item[1])
+
+    def render_prometheus(self):
+        lines = ['# TYPE bot_latency_seconds histogram']
+        for name, hist in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'bot_latency_seconds_bucket{{name="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'bot_latency_seconds_sum{{name="{name}"}} {hist.sum}')
+            lines.append(f'bot_latency_seconds_count{{name="{name}"}} {hist.count}')
+        with self._lock:
+            names = sorted({counter for counter, _ in self.counters})
+        for name in names:
+            lines.append(f'# TYPE {name} counter')
+            for label, value in self.counter_items(name):
+                lines.append(f'{name}{{name="{label}"}} {value}')
+        lines.append('# TYPE bot_uptime_seconds gauge')
+        lines.append(f'bot_uptime_seconds {time.time() - self.started:.0f}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def timed(name=None):
+    # 슬래시 명령어, 버튼, 모달 콜백에 붙여서 걸린 시간과 에러 수를 기록함
+    def decorator(func):
+        label = name or func.__qualname__
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                metrics.inc('bot_errors_total', label)
+                raise
+            finally:
+                metrics.observe(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
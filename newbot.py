@@ -1,25 +1,140 @@
 import discord
 from discord import app_commands
-import csv
 import json
-import random
-import string
+import io
+import csv
+import codecs
+import tempfile
 import os
+import functools
+import asyncio
+import heapq
+import aiohttp
+from aiohttp import web
 from datetime import datetime, timedelta
+from storage import UserStore, SqliteStore, csv_imported, NameCache, KeyPool, RevocationList, EventLog, USER_FIELDS, BAN_FIELDS, export_rows, run_io, run_locked_io, write_json, CachedFile, FileWatcher
+from treesync import sync_tree
+from metrics import metrics, timed
+from licenses import generate_keys, LicenseSigner, is_signed_license, license_id
+from analytics import summarize
+
+def parse_config(f):
+    config = json.load(f)
+    # 파일에는 리스트로 저장하고 메모리에서는 set 으로 들고 있음
+    config["admins"] = set(config.get("admins", []))
+    return config
 
-class MyClient(discord.Client):
+class MyClient(discord.AutoShardedClient):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
-        super().__init__(intents=intents)
+        # 여러 프로세스로 나눠서 실행할 때: SHARD_COUNT=4 SHARD_IDS=0,1 python newbot.py (프로세스마다 SHARD_IDS 를 다르게, storage 는 'sqlite' 여야 함)
+        # 안 넣으면 프로세스 하나가 필요한 만큼 샤드를 알아서 나눠서 씀
+        shard_count = os.environ.get('SHARD_COUNT')
+        shard_ids = os.environ.get('SHARD_IDS')
+        super().__init__(intents=intents,
+                         shard_count=int(shard_count) if shard_count else None,
+                         shard_ids=[int(shard_id) for shard_id in shard_ids.split(',')] if shard_ids else None)
+        self.sharded = bool(shard_ids) # 다른 프로세스와 데이터를 같이 씀
+        self.primary = not shard_ids or 0 in self.shard_ids # 만료 처리와 라이센스 확인 API 는 0번 샤드 프로세스에서만 실행함
+        self.refresh_interval = 5 # 여러 프로세스일 때 다른 프로세스가 폐기한 라이센스를 읽어오는 간격 (초)
+        self.refresh_task = None
         self.tree = app_commands.CommandTree(self)
         self.admin_id = 1238461591557771355
         self.config_file = r'config.json'
+        self.config_cache = CachedFile(self.config_file, parse_config) # 파일이 바뀌었을 때만 다시 읽음 (손으로 고쳐도 바로 반영됨)
+        self.file_watcher = FileWatcher() # inotify_simple 이 있으면 stat 도 안 하고 바뀐 것만 알려받음
         self.users_csv = r'users.csv'
+        self.banlist_csv = r'banlist.csv'
+        self.flush_delay = 1.0 # 유저 정보 저장을 모아서 처리할 시간 (초)
+        self.journal_file = r'users.journal' # None 으로 하면 저널 없이 csv 전체를 저장함
+        self.compact_size = 1024 * 1024 # 저널이 이 크기(바이트)를 넘으면 csv 로 합침
+        self.storage = 'csv' # 'sqlite' 로 하면 database 파일을 사용함 (처음 실행할 때 csv 를 옮겨옴, 옮긴 뒤에는 csv 로 돌아갈 수 없음)
+        self.database = r'license.db'
+        if self.storage == 'sqlite':
+            self.store = SqliteStore(self.database, users_csv=self.users_csv, banlist_csv=self.banlist_csv, journal_file=self.journal_file)
+        else:
+            self.store = UserStore(self.users_csv, self.banlist_csv, self.flush_delay, self.journal_file, self.compact_size)
+        self.name_cache = NameCache(r'names.json') # 차단 목록 등에 표시할 닉네임 캐시
+        self.key_pool = KeyPool(r'license_pool.txt') # /대량생성 으로 미리 만들어둔 키, /생성 할 때 여기서 먼저 꺼내씀
+        self.license_format = 'random' # 'signed' 로 하면 유저 아이디, 플랜, 만료일이 들어간 서명 라이센스를 발급함 (클라이언트가 서버 없이 확인 가능)
+        self.license_secret = None # 서명 라이센스 HMAC 비밀키
+        self.license_private_key = None # Ed25519 개인키 PEM 파일 경로, 있으면 HMAC 대신 사용 (cryptography 패키지 필요)
+        self.signer = LicenseSigner(self.license_secret, self.license_private_key) if self.license_format == 'signed' else None
+        self.commands_hash_file = r'commands.json' # 명령어가 바뀌었을 때만 sync 하려고 저장하는 해시
+        self.dev_guild_id = None # 개발용 서버 아이디, 넣으면 그 서버에만 명령어를 바로 등록함
+        self.churn_log = EventLog(r'unregistered.log') # 탈퇴한 시각, /분석 의 이탈률에 씀
+        # 폐기된 라이센스 번호, revoked.bin 은 외부 확인 프로그램이 mmap 해서 쓰는 파일 (GET /revoked)
+        # revoked.bin 은 다른 프로세스가 폐기한 것까지 읽어오는 0번 샤드 프로세스만 씀 (다른 프로세스가 쓰면 일부만 들어간 파일로 덮어씀)
+        self.revoked = RevocationList(r'revoked.txt', r'revoked.bin' if self.primary else None)
+        self.fetch_semaphore = asyncio.Semaphore(5) # 닉네임을 API 로 가져올 때 동시에 보낼 요청 수
+        self.expiry_action = 'revoke' # 만료일이 지나면 'revoke' 는 라이센스 삭제, 'downgrade' 는 free 플랜으로 변경
+        self.expiry = None
+        self.verify_host = '127.0.0.1' # 라이센스 확인 API 주소, verify_port 를 None 으로 하면 끔
+        self.verify_port = 8080
+        self.verify_runner = None
+        self.main_view = None
+        self.manage_view = None
+        self.plan_view = None
         
+    def check_storage(self):
+        # csv 는 프로세스마다 메모리에 따로 들고 있어서 여러 프로세스가 같이 쓸 수 없음
+        if self.sharded and self.storage != 'sqlite':
+            raise RuntimeError("SHARD_IDS 로 여러 프로세스를 실행하려면 storage 를 'sqlite' 로 설정하세요.")
+        # sqlite 로 옮긴 뒤의 변경은 csv 에 없어서 csv 로 실행하면 조용히 사라짐
+        if self.storage == 'csv' and csv_imported(self.database):
+            raise RuntimeError(f"{self.database} 로 이미 옮겼습니다. storage 를 'sqlite' 로 설정하세요.")
+
     async def setup_hook(self):
-        await self.tree.sync()
+        self.check_storage()
+        count_rest_requests(self.http)
+        await self.store.load()
+        await self.name_cache.load()
+        await self.key_pool.load()
+        await self.revoked.load()
+        await self.churn_log.load()
+        self.file_watcher.watch(self.config_cache)
+        self.file_watcher.start()
+        await load_config()
+        # 패널 버튼은 custom_id 로 찾아서 처리하니까 봇이 다시 켜져도 예전에 올린 패널이 계속 동작함
+        # 여기 등록한 객체는 custom_id 처리용으로만 쓰고, ephemeral 메시지에는 새로 만들어서 보냄
+        # (discord.py 가 ephemeral 로 보낸 view 에는 15분 timeout 을 걸어서 등록한 객체가 멈춰버림)
+        self.main_view = MainView()
+        self.manage_view = ManageView()
+        self.plan_view = PlanView()
+        for view in (self.main_view, self.manage_view, self.plan_view):
+            self.add_view(view)
+        # 다른 프로세스에서 바뀐 만료일은 한 시간마다 전체를 다시 읽어서 반영함
+        self.expiry = ExpiryScheduler(self.store, self.expiry_action, resync_interval=3600 if self.sharded else None)
+        if self.primary:
+            await self.expiry.start()
+            if self.verify_port is not None:
+                await start_verify_server()
+            if self.sharded:
+                self.refresh_task = asyncio.get_running_loop().create_task(refresh_revoked(self.refresh_interval))
+        await sync_tree(self.tree, self.commands_hash_file, self.dev_guild_id)
+
+    async def close(self):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+        self.file_watcher.stop()
+        if self.expiry is not None:
+            self.expiry.stop()
+        if self.verify_runner is not None:
+            await self.verify_runner.cleanup()
+        await self.store.close()
+        await self.revoked.close()
+        await self.name_cache.save()
+        await super().close()
+
+def count_rest_requests(http):
+    # 디스코드 API 요청을 라우트별로 셈 (예: GET /users/{user_id})
+    request = http.request
+    async def counted_request(route, **kwargs):
+        metrics.inc('discord_rest_requests_total', f'{route.method} {route.path}')
+        return await request(route, **kwargs)
+    http.request = counted_request
 
 client = MyClient()
 
@@ -29,10 +144,12 @@ class ConfirmView(discord.ui.View):
         self.value = None
 
     @discord.ui.button(label="탈퇴", style=discord.ButtonStyle.danger)
+    @timed()
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_modal(UnregisterModal())
 
     @discord.ui.button(label="취소", style=discord.ButtonStyle.secondary)
+    @timed()
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.value = False
         embed = discord.Embed(title="취소됨", description="탈퇴가 취소되었습니다.", color=discord.Color.blue())
@@ -47,129 +164,332 @@ class UnregisterModal(discord.ui.Modal, title="탈퇴 확인"):
         required=True,
     )
 
+    @timed()
     async def on_submit(self, interaction: discord.Interaction):
         if self.confirm_text.value == "탈퇴":
             user_id = interaction.user.id
-            remove_user(user_id)
+            await remove_user(user_id)
             embed = discord.Embed(title="SUCCESS", description="탈퇴가 완료되었습니다. 모든 라이센스가 삭제되었습니다.\n저희 서비스를 이용해주셔서 감사합니다.", color=discord.Color.green())
         else:
             embed = discord.Embed(title="취소됨", description="올바른 확인 텍스트를 입력하지 않아 탈퇴가 취소되었습니다.", color=discord.Color.blue())
         
         await interaction.response.edit_message(embed=embed, view=None)
 
-def load_config():
+async def load_config():
+    # 파일의 mtime, 크기, inode 가 그대로면 전에 읽은 것을 사용하고, 바뀌었을 때만 다시 읽음
+    # 다른 프로세스가 저장했거나 손으로 고친 것도 다음 호출에서 바로 반영됨
+    cache = client.config_cache
+    if not cache.changed():
+        return cache.data
     if os.path.exists(client.config_file):
         try:
-            with open(client.config_file, 'r') as f:
-                return json.load(f)
+            return await run_locked_io(client.config_file, cache.reload)
         except json.JSONDecodeError:
+            if cache.loaded:
+                # 고치는 도중에 저장된 파일일 수 있으니 덮어쓰지 않고 이전 설정을 씀
+                print("JSON 파일이 잘못된 형식입니다. 이전 설정을 그대로 사용합니다.")
+                return cache.data
             print("JSON 파일이 잘못된 형식입니다. 기본값을 사용합니다.")
-            return initialize_config()
+            return await initialize_config()
     else:
-        return initialize_config()
+        return await initialize_config()
 
-def initialize_config():
-    config = {"admins": []}
-    save_config(config)
+async def initialize_config():
+    config = {"admins": set()}
+    await save_config(config)
     return config
 
-def save_config(config):
-    with open(client.config_file, 'w') as f:
-        json.dump(config, f, indent=4)
-
-def load_users():
-    if os.path.exists(client.users_csv):
-        users = {}
-        with open(client.users_csv, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                users[int(row['user_id'])] = row
-        return users
-    return {}
-
-def load_banlist():
-    if os.path.exists('banlist.csv'):
-        banlist = {}
-        with open('banlist.csv', 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                banlist[int(row['user_id'])] = row['reason']
-        return banlist
-    return {}
-
-def save_banlist(banlist):
-    with open('banlist.csv', 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=['user_id', 'reason'])
-        writer.writeheader()
-        for user_id, reason in banlist.items():
-            writer.writerow({'user_id': user_id, 'reason': reason})
-
-def save_users(users):
-    with open(client.users_csv, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=['user_id', 'username', 'license', 'plan', 'expiry_date'])
-        writer.writeheader()
-        for user_id, user_info in users.items():
-            writer.writerow(user_info)
-
-def is_admin(user_id):
-    config = load_config()
+async def save_config(config):
+    data = dict(config, admins=sorted(config["admins"]))
+    await run_locked_io(client.config_file, write_json, client.config_file, data)
+
+async def is_admin(user_id):
+    config = await load_config()
     return user_id in config["admins"]
 
-def is_banned(user_id):
-    banlist = load_banlist()
-    return user_id in banlist
-
-def get_user_info(user_id):
-    users = load_users()
-    return users.get(user_id, {})
-
-def add_user(user_id, username):
-    users = load_users()
-    if user_id not in users:
-        users[user_id] = {
-            'user_id': user_id,
-            'username': username,
-            'license': '',
-            'plan': 'None',
-            'expiry_date': ''
-        }
-        save_users(users)
-
-def remove_user(user_id):
-    users = load_users()
-    if user_id in users:
-        del users[user_id]
-        save_users(users)
+async def is_banned(user_id):
+    return await client.store.is_banned(user_id)
+
+async def get_user_info(user_id):
+    return await client.store.get(user_id)
+
+async def add_user(user_id, username):
+    if not await client.store.get(user_id):
+        await client.store.register(user_id, username)
+
+async def remove_user(user_id):
+    user_info = await client.store.get(user_id)
+    if user_info:
+        await revoke_license(user_info.get('license'))
+        await client.churn_log.add(user_id)
+    await client.store.unregister(user_id)
+
+async def update_user(user_id, **fields):
+    # 서명 라이센스는 플랜과 만료일이 키 안에 들어있어서 바뀌면 키를 다시 발급함
+    user_info = await client.store.get(user_id)
+    if 'license' in fields:
+        await revoke_license(user_info.get('license'))
+    elif client.signer is not None and user_info.get('license') and ('plan' in fields or 'expiry_date' in fields):
+        await issue_license(user_id, **fields)
+        return
+    await client.store.update(user_id, **fields)
+
+class Access:
+    def __init__(self, user_id, user_info, banned, admin):
+        self.user_id = user_id
+        self.user_info = user_info
+        self.banned = banned
+        self.admin = admin
+
+    @property
+    def registered(self):
+        return bool(self.user_info)
+
+async def resolve_access(user_id):
+    user_info, banned = await client.store.lookup(user_id)
+    config = await load_config()
+    admin = user_id == client.admin_id or user_id in config["admins"]
+    return Access(user_id, user_info, banned, admin)
+
+def access_check(admin=False, ban=False):
+    # 차단, 가입, 관리자 여부를 한 번에 확인해서 interaction.extras['access'] 에 넣어줌
+    # 슬래시 명령어와 버튼 콜백 둘 다 사용 가능
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next(arg for arg in args if isinstance(arg, discord.Interaction))
+            access = await resolve_access(interaction.user.id)
+            interaction.extras['access'] = access
+            if ban and access.banned:
+                embed = discord.Embed(title="ERROR", description="BOT Service 에서 차단된 유저입니다.", color=discord.Color.red())
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            if admin and not access.admin:
+                embed = discord.Embed(title="ERROR", description="당신은 이 명령어를 사용할 권한이 없습니다.", color=discord.Color.red())
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+async def resolve_names(user_ids):
+    # 게이트웨이 캐시 -> 닉네임 캐시 -> API 순서로 찾고 API 요청은 동시에 보냄
+    names = {}
+    missing = []
+    for user_id in user_ids:
+        user = client.get_user(user_id)
+        if user is not None:
+            names[user_id] = user.name
+            continue
+        name = client.name_cache.get(user_id)
+        if name is not None:
+            names[user_id] = name
+        else:
+            missing.append(user_id)
+
+    async def fetch(user_id):
+        async with client.fetch_semaphore:
+            try:
+                user = await client.fetch_user(user_id)
+                return user_id, user.name
+            except discord.NotFound:
+                return user_id, ''
+
+    if missing:
+        for user_id, name in await asyncio.gather(*(fetch(user_id) for user_id in missing)):
+            names[user_id] = name
+            client.name_cache.put(user_id, name)
+        await client.name_cache.save()
+    return names
+
+class ExpiryScheduler:
+    # 만료일이 가장 가까운 라이센스부터 꺼내는 힙, 다음 만료일까지 자다가 깨서 처리함
+    # 만료일이 바뀌면 새 항목만 넣고 예전 항목은 꺼낼 때 유저 정보와 비교해서 버림
+    def __init__(self, store, action='revoke', resync_interval=None):
+        self.store = store
+        self.action = action
+        self.resync_interval = resync_interval # 다른 프로세스가 바꾼 만료일도 반영하려면 이 간격 (초) 마다 힙을 다시 만듦
+        self.heap = []
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.resync_task = None
+
+    async def load(self):
+        # 라이센스와 만료일이 있는 유저만 가져옴 (sqlite 는 만료일 인덱스만 읽음), 정렬된 목록이라 그대로 힙으로 씀
+        self.heap = [(expiry_date, int(user_id)) for expiry_date, user_id in await self.store.license_expiries()]
+
+    async def start(self):
+        await self.load()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        if self.resync_interval:
+            self.resync_task = asyncio.get_running_loop().create_task(self.resync())
+
+    def stop(self):
+        for task in (self.task, self.resync_task):
+            if task is not None:
+                task.cancel()
+        self.task = None
+        self.resync_task = None
+
+    async def resync(self):
+        while True:
+            await asyncio.sleep(self.resync_interval)
+            await self.load()
+            self.wakeup.set()
+
+    def schedule(self, user_id, expiry_date):
+        # 시작하지 않은 스케줄러 (0번 샤드가 아닌 프로세스) 는 아무것도 안 함
+        if not expiry_date or self.task is None:
+            return
+        entry = (expiry_date, int(user_id))
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] == entry:
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            if not self.heap:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            expiry_date, user_id = self.heap[0]
+            # 만료일 당일까지는 사용 가능하고 다음 날 0시에 만료됨
+            deadline = datetime.strptime(expiry_date, "%Y-%m-%d") + timedelta(days=1)
+            delay = (deadline - datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=min(delay, 24 * 60 * 60))
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            heapq.heappop(self.heap)
+            user_info = await self.store.get(user_id)
+            if user_info.get('license') and user_info.get('expiry_date') == expiry_date:
+                await self.expire(user_id)
+
+    async def expire(self, user_id):
+        if self.action == 'downgrade':
+            await self.store.update(user_id, plan='free', expiry_date='')
+        else:
+            await self.store.update(user_id, license='', plan='None', expiry_date='')
+        print(f'{user_id} 의 라이센스가 만료되었습니다.')
+
+async def refresh_revoked(interval):
+    # 다른 샤드 프로세스가 폐기 목록 파일에 추가한 번호를 주기적으로 읽어옴
+    while True:
+        await asyncio.sleep(interval)
+        await client.revoked.refresh()
+
+async def verify_handler(request):
+    # GET /verify?key=XXXX-XXXX-XXXX-XXXX, 메모리에 있는 인덱스만 보고 응답함
+    key = request.query.get('key', '').strip().upper()
+    if not key:
+        return web.json_response({'valid': False, 'error': 'key 가 필요합니다.'}, status=400)
+    if client.signer is not None and is_signed_license(key):
+        # 서명 라이센스는 서명과 폐기 목록만 확인함
+        info = client.signer.verify(key)
+        if info is None:
+            return web.json_response({'valid': False})
+        revoked = license_id(key) in client.revoked
+        expired = info['expiry_date'] is not None and info['expiry_date'] < datetime.now().strftime("%Y-%m-%d")
+        return web.json_response({
+            'valid': not revoked and not expired,
+            'user_id': str(info['user_id']),
+            'plan': info['plan'],
+            'expiry_date': info['expiry_date'],
+            'revoked': revoked
+        })
+    if license_id(key) in client.revoked:
+        return web.json_response({'valid': False, 'revoked': True})
+    user_info = await client.store.find_by_license(key)
+    if not user_info:
+        return web.json_response({'valid': False})
+    user_id = int(user_info['user_id'])
+    banned = await client.store.is_banned(user_id)
+    expiry_date = user_info.get('expiry_date') or None
+    expired = expiry_date is not None and expiry_date < datetime.now().strftime("%Y-%m-%d")
+    return web.json_response({
+        'valid': not banned and not expired,
+        'user_id': str(user_id),
+        'plan': user_info.get('plan'),
+        'expiry_date': expiry_date,
+        'banned': banned
+    })
+
+async def revoked_handler(request):
+    # 폐기 목록 바이너리 파일을 그대로 내려줌, 형식은 licenses.RevocationFile 참고
+    return web.FileResponse(client.revoked.export_path)
+
+async def metrics_handler(request):
+    # Prometheus 형식
+    return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+async def start_verify_server():
+    app = web.Application()
+    app.router.add_get('/verify', verify_handler)
+    app.router.add_get('/revoked', revoked_handler)
+    app.router.add_get('/metrics', metrics_handler)
+    # 요청마다 로그를 남기지 않고 keep-alive 연결을 재사용함
+    runner = web.AppRunner(app, access_log=None, keepalive_timeout=75)
+    await runner.setup()
+    site = web.TCPSite(runner, client.verify_host, client.verify_port)
+    await site.start()
+    client.verify_runner = runner
+    print(f'라이센스 확인 API 가 http://{client.verify_host}:{client.verify_port}/verify 에서 실행 중입니다.')
 
 def generate_license():
-    chars = ''.join(random.choices(string.ascii_uppercase + string.digits, k=16))
-    return '-'.join([chars[i:i+4] for i in range(0, 16, 4)])
+    return generate_keys(1)[0]
+
+async def revoke_license(license):
+    # 버리는 키는 폐기 목록에 넣어서 서버 없이 확인하는 클라이언트도 알 수 있게 함
+    if license:
+        await client.revoked.add(license_id(license))
+
+async def issue_license(user_id, **fields):
+    # 키 풀에 남은 키가 있으면 먼저 쓰고, 라이센스 인덱스로 다른 유저와 겹치지 않는지 확인해서 겹치면 다시 만듦
+    user_info = await get_user_info(user_id) or {}
+    for _ in range(10):
+        if client.signer is not None:
+            # 서명 라이센스는 플랜과 만료일이 키에 들어가서 키 풀을 쓰지 않음
+            info = dict(user_info, **fields)
+            license_code = client.signer.sign(user_id, info.get('plan') or 'None', info.get('expiry_date'))
+        else:
+            license_code = await client.key_pool.claim() or generate_license()
+        if await client.store.assign_license(user_id, license_code, **fields):
+            await revoke_license(user_info.get('license'))
+            return license_code
+    raise RuntimeError("중복되지 않는 라이센스를 만들지 못했습니다.")
 
 @client.event
 async def on_ready():
     print(f'봇이 {client.user}로 로그인했습니다.')
 
 @client.tree.command(name="정보", description="정보를 확인합니다.")
+@timed()
+@access_check()
 async def my_info(interaction: discord.Interaction, user: discord.User = None):
+    access = interaction.extras['access']
     if user != None:
-        if interaction.user.id != client.admin_id and is_admin(interaction.user.id) != True:
+        if access.admin != True:
             embed = discord.Embed(title="ERROR", description="당신은 이 명령어를 사용할 권한이 없습니다.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
         else:
             user_id = user.id
+            access = await resolve_access(user_id)
     else:
         user_id = interaction.user.id
 
     
-    user_info = get_user_info(user_id)
+    user_info = access.user_info
     
     if not user_info:
         embed = discord.Embed(title="ERROR", description="가입되지 않은 사용자입니다.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
     
-    banned_status = "차단됨" if user_info.get('banned') == 'True' else "차단되지 않음"
+    banned_status = "차단됨" if access.banned else "차단되지 않음"
     license_info = user_info.get('license', '라이센스 없음')
     plan = user_info.get('plan', '없음')
     expiry_date = user_info.get('expiry_date', '없음')
@@ -195,6 +515,7 @@ async def my_info(interaction: discord.Interaction, user: discord.User = None):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @client.tree.command(name="총관리자", description="총관리자를 추가하거나 삭제합니다.")
+@timed()
 @app_commands.describe(action="추가하거나 삭제할 작업", user="총관리자 상태로 만들거나 삭제할 사용자")
 @app_commands.choices(action=[
     app_commands.Choice(name="추가", value="add"),
@@ -202,12 +523,12 @@ async def my_info(interaction: discord.Interaction, user: discord.User = None):
 ])
 async def manage_admin(interaction: discord.Interaction, action: str, user: discord.User):
     if interaction.user.id == client.admin_id:
-        config = load_config()
+        config = await load_config()
         embed = discord.Embed()
         if action == "add":
             if user.id not in config["admins"]:
-                config["admins"].append(user.id)
-                save_config(config)
+                config["admins"].add(user.id)
+                await save_config(config)
                 embed.title = "SUCCESS"
                 embed.description = f"{user.name}을 총관리자로 추가했습니다."
                 embed.color = discord.Color.green()
@@ -217,8 +538,8 @@ async def manage_admin(interaction: discord.Interaction, action: str, user: disc
                 embed.color = discord.Color.red()
         elif action == "remove":
             if user.id in config["admins"]:
-                config["admins"].remove(user.id)
-                save_config(config)
+                config["admins"].discard(user.id)
+                await save_config(config)
                 embed.title = "SUCCESS"
                 embed.description = f"{user.name}을 총관리자에서 삭제했습니다."
                 embed.color = discord.Color.green()
@@ -236,17 +557,18 @@ async def manage_admin(interaction: discord.Interaction, action: str, user: disc
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @client.tree.command(name="차단", description="사용자를 차단하거나 차단을 해제합니다.")
+@timed()
 @app_commands.describe(action="차단하거나 차단 해제할 작업", user="차단하거나 차단 해제할 사용자", reason="차단 사유 (차단 시에만 필요)")
 @app_commands.choices(action=[
     app_commands.Choice(name="추가", value="add"),
     app_commands.Choice(name="삭제", value="remove")
 ])
+@access_check()
 async def manage_ban(interaction: discord.Interaction, action: str, user: discord.User, reason: str = None):
-    if is_admin(interaction.user.id):
-        banlist = load_banlist()
+    if interaction.extras['access'].admin:
         embed = discord.Embed()
         if action == "add":
-            if user.id in banlist:
+            if await is_banned(user.id):
                 embed.title = "ERROR"
                 embed.description = f"{user.name}은 이미 차단된 사용자입니다."
                 embed.color = discord.Color.red()
@@ -256,19 +578,22 @@ async def manage_ban(interaction: discord.Interaction, action: str, user: discor
                     embed.description = "차단 사유를 입력해주세요."
                     embed.color = discord.Color.red()
                 else:
-                    banlist[user.id] = reason
-                    save_banlist(banlist)
+                    await client.store.ban(user.id, reason)
+                    user_info = await get_user_info(user.id)
+                    if user_info and user_info.get('license'):
+                        # 폐기된 키를 그대로 두면 /정보 에는 보이는데 /verify 는 거부하고 /생성 도 막히므로 키를 지움
+                        # 차단을 해제하면 /생성 으로 새 키를 받을 수 있음
+                        await update_user(user.id, license='')
                     embed.title = "SUCCESS"
                     embed.description = f"{user.name}을 차단했습니다.\n 사유: {reason}"
                     embed.color = discord.Color.green()
         elif action == "remove":
-            if user.id not in banlist:
+            if not await is_banned(user.id):
                 embed.title = "ERROR"
                 embed.description = f"{user.name}은 차단된 사용자가 아닙니다."
                 embed.color = discord.Color.red()
             else:
-                del banlist[user.id]
-                save_banlist(banlist)
+                await client.store.unban(user.id)
                 embed.title = "SUCCESS"
                 embed.description = f"{user.name}의 차단을 해제했습니다."
                 embed.color = discord.Color.green()
@@ -281,32 +606,182 @@ async def manage_ban(interaction: discord.Interaction, action: str, user: discor
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+async def iter_attachment_lines(attachment, chunk_size=64 * 1024):
+    # 첨부 파일을 한 번에 받아두지 않고 chunk_size 씩 받으면서 그 안에서 끝난 줄들을 리스트로 돌려줌
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    async with aiohttp.ClientSession() as session, session.get(attachment.url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(chunk_size):
+            lines = (pending + decoder.decode(chunk)).splitlines(keepends=True)
+            # 마지막 줄이 아직 안 끝났으면 다음 조각과 이어붙임
+            pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+            if lines:
+                yield lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield [pending]
+
+def read_ban_rows(lines):
+    # 줄들을 읽어서 (user_id, reason) 을 돌려줌, user_id 가 숫자가 아닌 줄 (헤더 등) 은 None
+    for row in csv.reader(lines):
+        if not any(field.strip() for field in row):
+            continue
+        user_id = row[0].strip()
+        if not user_id.isdigit():
+            yield None
+            continue
+        reason = row[1].strip() if len(row) > 1 else ''
+        yield int(user_id), reason or None
+
+@client.tree.command(name="대량차단", description="첨부한 CSV/텍스트 파일의 유저들을 한 번에 차단하거나 차단 해제합니다.")
+@timed()
+@app_commands.describe(action="차단하거나 차단 해제할 작업", file="한 줄에 user_id, 사유 형식의 파일 (사유는 생략 가능)")
+@app_commands.choices(action=[
+    app_commands.Choice(name="추가", value="add"),
+    app_commands.Choice(name="삭제", value="remove")
+])
+@access_check(admin=True)
+async def bulk_ban(interaction: discord.Interaction, action: str, file: discord.Attachment):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    entries = {}
+    skipped = 0
+    rows = 0
+    async for lines in iter_attachment_lines(file):
+        for row in read_ban_rows(lines):
+            if row is None:
+                skipped += 1
+                continue
+            rows += 1
+            entries.setdefault(row[0], row[1])
+
+    if action == "add":
+        changed = await client.store.ban_many(entries.items())
+        # 차단된 유저의 라이센스를 한 번에 찾아서 폐기 목록에 넣고 저장소에서도 지움 (/차단 과 같음)
+        licenses = await client.store.user_licenses(entries)
+        await client.revoked.add_many([license_id(license) for license in licenses.values()])
+        await client.store.update_many(licenses, license='')
+        description = f"{changed}명을 차단했습니다."
+    else:
+        changed = await client.store.unban_many(entries)
+        description = f"{changed}명의 차단을 해제했습니다."
+
+    embed = discord.Embed(title="SUCCESS", description=description, color=discord.Color.green())
+    embed.add_field(name="**읽은 줄**", value=rows)
+    embed.add_field(name="**중복/변경 없음**", value=rows - changed)
+    embed.add_field(name="**건너뛴 줄**", value=skipped)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+async def iter_ban_rows():
+    async for user_id, reason in client.store.iter_banlist():
+        yield {'user_id': user_id, 'reason': reason}
+
+@client.tree.command(name="내보내기", description="유저, 라이센스, 차단 데이터를 gzip 으로 압축한 파일로 내보냅니다.")
+@timed()
+@app_commands.describe(data="내보낼 데이터", fmt="파일 형식")
+@app_commands.choices(data=[
+    app_commands.Choice(name="유저/라이센스", value="users"),
+    app_commands.Choice(name="차단", value="banlist"),
+    app_commands.Choice(name="전체", value="all")
+], fmt=[
+    app_commands.Choice(name="CSV", value="csv"),
+    app_commands.Choice(name="JSONL", value="jsonl")
+])
+@access_check(admin=True)
+async def export_data(interaction: discord.Interaction, data: str, fmt: str = "csv"):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    tables = []
+    if data in ("users", "all"):
+        tables.append(("users", client.store.iter_users(), USER_FIELDS))
+    if data in ("banlist", "all"):
+        tables.append(("banlist", iter_ban_rows(), BAN_FIELDS))
+
+    limit = interaction.guild.filesize_limit if interaction.guild else 25 * 1024 * 1024
+    files = []
+    counts = []
+    for name, rows, fieldnames in tables:
+        # 임시 파일에 조금씩 압축해서 쓰고 그대로 첨부함
+        fp = tempfile.TemporaryFile()
+        count = await export_rows(rows, fieldnames, fp, fmt)
+        if fp.tell() > limit:
+            fp.close()
+            for file in files:
+                file.close()
+            embed = discord.Embed(title="ERROR", description=f"{name} 파일이 첨부 가능한 크기 ({limit // (1024 * 1024)}MB) 를 넘습니다.", color=discord.Color.red())
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
+        fp.seek(0)
+        files.append(discord.File(fp, filename=f"{name}.{fmt}.gz"))
+        counts.append(f"{name}: {count}줄")
+
+    embed = discord.Embed(title="SUCCESS", description="\n".join(counts), color=discord.Color.green())
+    await interaction.followup.send(embed=embed, files=files, ephemeral=True)
+
+@client.tree.command(name="통계", description="명령어 응답 시간, 저장소 I/O, API 요청 수를 표시합니다.")
+@timed()
+@access_check(admin=True)
+async def show_stats(interaction: discord.Interaction):
+    embed = discord.Embed(title="통계", color=discord.Color.blue())
+    rows = sorted(metrics.latency.items(), key=lambda item: -item[1].count)
+    latency = [f"{name}: {hist.count}회, p50 {hist.percentile(0.5) * 1000:.1f}ms / p95 {hist.percentile(0.95) * 1000:.1f}ms / p99 {hist.percentile(0.99) * 1000:.1f}ms"
+               for name, hist in rows if not name.startswith('storage.')]
+    storage_ops = [f"{name}: {value}회" for name, value in metrics.counter_items('storage_ops_total')]
+    storage_bytes = [f"{name}: 읽기 {dict(metrics.counter_items('storage_bytes_read_total')).get(name, 0):,}B / 쓰기 {value:,}B"
+                     for name, value in metrics.counter_items('storage_bytes_written_total')]
+    rest = [f"{name}: {value}회" for name, value in metrics.counter_items('discord_rest_requests_total')]
+    errors = [f"{name}: {value}회" for name, value in metrics.counter_items('bot_errors_total')]
+    for title, lines in (("명령어/버튼 응답 시간", latency), ("저장소 작업", storage_ops), ("저장소 바이트", storage_bytes), ("API 요청", rest), ("에러", errors)):
+        # 필드 하나에 1024자까지만 들어감
+        embed.add_field(name=f"**{title}**", value="\n".join(lines[:15])[:1024] or "없음", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@client.tree.command(name="분석", description="플랜별 유저 수, 주별 만료 예정, 가입/탈퇴 추이를 표시합니다.")
+@timed()
+@app_commands.describe(weeks="표시할 주 수 (기본 8주)")
+@access_check(admin=True)
+async def show_analytics(interaction: discord.Interaction, weeks: app_commands.Range[int, 1, 26] = 8):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    start = asyncio.get_running_loop().time()
+    if client.sharded:
+        await client.churn_log.refresh()
+    columns = await client.store.user_columns()
+    stats = await run_io(summarize, columns, client.churn_log.times[:], weeks)
+    elapsed = asyncio.get_running_loop().time() - start
+
+    embed = discord.Embed(title="분석", color=discord.Color.blue())
+    embed.add_field(name="**유저**", value=f"{stats['total']:,}명 (라이센스 {stats['licensed']:,}명)")
+    embed.add_field(name="**이탈률 (최근 4주)**", value=f"{stats['churn_rate'] * 100:.1f}%")
+    total = stats['total'] or 1
+    plans = [f"{plan}: {count:,}명 ({count / total * 100:.1f}%)" for plan, count in stats['plans'].items()]
+    embed.add_field(name="**플랜별**", value="\n".join(plans), inline=False)
+    expiring = [f"이미 만료: {stats['expired']:,}"]
+    expiring += [f"{week}주 후: {count:,}" if week else f"이번 주: {count:,}" for week, count in enumerate(stats['expiring'])]
+    embed.add_field(name="**주별 만료 예정**", value="\n".join(expiring))
+    trend = [f"{week}주 전: +{joined:,} / -{left:,}" if week else f"이번 주: +{joined:,} / -{left:,}"
+             for week, (joined, left) in enumerate(zip(stats['registered'], stats['unregistered']))]
+    embed.add_field(name="**주별 가입/탈퇴**", value="\n".join(trend))
+    embed.set_footer(text=f"{elapsed * 1000:.0f}ms")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
 @client.tree.command(name="가입", description="봇 사용을 위한 가입을 합니다.")
+@timed()
+@access_check(ban=True)
 async def register(interaction: discord.Interaction):
     user_id = interaction.user.id
-    if is_banned(user_id):
-        embed = discord.Embed(title="ERROR", description="BOT Service 에서 차단된 유저입니다.", color=discord.Color.red())
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-
-    if get_user_info(user_id):
+    if interaction.extras['access'].registered:
         embed = discord.Embed(title="ERROR", description="이미 가입된 사용자입니다.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
 
-    add_user(user_id, interaction.user.name)
+    await add_user(user_id, interaction.user.name)
     embed = discord.Embed(title="SUCCESS", description="가입이 완료되었습니다. 이제 명령어를 사용할 수 있습니다.", color=discord.Color.green())
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @client.tree.command(name="탈퇴", description="봇 사용을 위한 탈퇴를 합니다.")
+@timed()
+@access_check(ban=True)
 async def unregister(interaction: discord.Interaction):
-    user_id = interaction.user.id
-    if is_banned(user_id):
-        embed = discord.Embed(title="ERROR", description="BOT Service에서 차단된 유저입니다.", color=discord.Color.red())
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-
-    if not get_user_info(user_id):
+    if not interaction.extras['access'].registered:
         embed = discord.Embed(title="ERROR", description="가입되지 않은 사용자입니다.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
@@ -316,14 +791,15 @@ async def unregister(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 @discord.ui.button(label="탈퇴", style=discord.ButtonStyle.danger)
+@timed()
 async def unregister_button(self, interaction: discord.Interaction, button: discord.ui.Button):
     user_id = interaction.user.id
-    if is_banned(user_id):
+    if await is_banned(user_id):
         embed = discord.Embed(title="ERROR", description="BOT Service에서 차단된 유저입니다.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
 
-    if not get_user_info(user_id):
+    if not await get_user_info(user_id):
         embed = discord.Embed(title="ERROR", description="가입되지 않은 사용자입니다.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
@@ -333,14 +809,11 @@ async def unregister_button(self, interaction: discord.Interaction, button: disc
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 @client.tree.command(name="생성", description="새로운 라이센스를 생성합니다.")
+@timed()
+@access_check(ban=True)
 async def create_license(interaction: discord.Interaction):
     user_id = interaction.user.id
-    if is_banned(user_id):
-        embed = discord.Embed(title="ERROR", description="BOT Service 에서 차단된 유저입니다.", color=discord.Color.red())
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-
-    user_info = get_user_info(user_id)
+    user_info = interaction.extras['access'].user_info
     if not user_info:
         embed = discord.Embed(title="ERROR", description=f"가입되지 않은 사용자입니다.\n /가입 명령어를 사용하여 가입하십시오.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -351,74 +824,115 @@ async def create_license(interaction: discord.Interaction):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
 
-    license_code = generate_license()
     plan = "free"  # 기본 플랜을 deluxe로 변경
     expiry_date = (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
     
-    user_info['license'] = license_code
-    user_info['plan'] = plan
-    user_info['expiry_date'] = expiry_date
-    save_users({user_id: user_info})
+    license_code = await issue_license(user_id, plan=plan, expiry_date=expiry_date)
+    client.expiry.schedule(user_id, expiry_date)
     
     embed = discord.Embed(title="SUCCESS", description=f"새로운 라이센스가 생성되었습니다\n ```{license_code}```", color=discord.Color.green())
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+class ListView(discord.ui.View):
+    # 목록을 한 페이지씩만 가져와서 보여줌, 이전/다음 버튼을 누를 때마다 해당 페이지만 다시 가져옴
+    def __init__(self, title, fetch_page, format_rows, page_size=20):
+        super().__init__(timeout=300)
+        self.title = title
+        self.fetch_page = fetch_page
+        self.format_rows = format_rows
+        self.page_size = page_size
+        self.page = 0
+
+    async def render(self):
+        # 다음 페이지가 있는지 알기 위해 한 개 더 가져옴
+        rows = await self.fetch_page(self.page * self.page_size, self.page_size + 1)
+        has_next = len(rows) > self.page_size
+        lines = await self.format_rows(rows[:self.page_size])
+        self.prev_button.disabled = self.page == 0
+        self.next_button.disabled = not has_next
+        embed = discord.Embed(title=self.title, description="\n".join(lines)[:4096], color=discord.Color.blue())
+        embed.set_footer(text=f"{self.page + 1} 페이지")
+        return embed, bool(lines)
+
+    @discord.ui.button(label="이전", style=discord.ButtonStyle.secondary)
+    @timed()
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        embed, _ = await self.render()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="다음", style=discord.ButtonStyle.secondary)
+    @timed()
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        embed, _ = await self.render()
+        await interaction.response.edit_message(embed=embed, view=self)
+
 @client.tree.command(name="목록", description="라이센스, 유저, 차단, 총관리자 목록을 표시합니다.")
-@app_commands.describe(option="표시할 목록의 종류")
+@timed()
+@app_commands.describe(option="표시할 목록의 종류", plan="이 플랜인 유저만 표시 (라이센스, 유저)", expiry_days="N일 안에 만료되는 유저만 표시 (라이센스, 유저)")
 @app_commands.choices(option=[
     app_commands.Choice(name="라이센스", value="licenses"),
     app_commands.Choice(name="유저", value="users"),
     app_commands.Choice(name="차단", value="banned"),
     app_commands.Choice(name="총관리자", value="admins")
+], plan=[
+    app_commands.Choice(name="Free", value="free"),
+    app_commands.Choice(name="Standard", value="standard"),
+    app_commands.Choice(name="Premium", value="premium"),
+    app_commands.Choice(name="Deluxe", value="deluxe")
 ])
-async def list_info(interaction: discord.Interaction, option: str):
-    user_id = interaction.user.id
-    if not is_admin(user_id) and user_id != client.admin_id:
-        embed = discord.Embed(title="ERROR", description="당신은 이 명령어를 사용할 권한이 없습니다.", color=discord.Color.red())
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-
-    users = load_users()
+@access_check(admin=True)
+async def list_info(interaction: discord.Interaction, option: str, plan: str = None, expiry_days: int = None):
+    expires_before = None
+    if expiry_days is not None:
+        expires_before = (datetime.now() + timedelta(days=expiry_days)).strftime("%Y-%m-%d")
 
     if option == "licenses":
-        licenses = [info for info in users.values() if info.get('license')]
-        if licenses:
-            license_list = "\n".join([f"사용자: {info['username']}, 라이센스: {info['license']}" for info in licenses])
-            embed = discord.Embed(title="라이센스 목록", description=license_list, color=discord.Color.blue())
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        async def fetch_page(offset, limit):
+            return await client.store.page_users(offset, limit, plan, expires_before, licensed=True)
+
+        async def format_rows(rows):
+            return [f"사용자: {info['username']}, 라이센스: {info['license']}" for info in rows]
+
+        view = ListView("라이센스 목록", fetch_page, format_rows)
+        embed, found = await view.render()
+        if found:
+            await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
         else:
             embed = discord.Embed(title="ERROR", description="생성된 라이센스가 없습니다.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
     
     elif option == "users":
-        user_list = "\n".join([info['username'] for info in users.values()])
-        embed = discord.Embed(title="유저 목록", description=user_list, color=discord.Color.blue())
-        if user_list:
-            await interaction.response.send_message(embed=embed, ephemeral=True, color=discord.Color.blue())    
+        async def fetch_page(offset, limit):
+            return await client.store.page_users(offset, limit, plan, expires_before)
+
+        async def format_rows(rows):
+            return [info['username'] for info in rows]
+
+        view = ListView("유저 목록", fetch_page, format_rows)
+        embed, found = await view.render()
+        if found:
+            await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
         else:
             embed = discord.Embed(title="ERROR", description="가입된 유저가 없습니다.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
     elif option == "banned":
-        banlist = load_banlist()
-        if banlist:
-            banned_list = []
-            for user_id, reason in banlist.items():
-                try:
-                    user = await client.fetch_user(user_id)
-                    banned_list.append(f"닉네임: {user.name}, ID: {user_id}, 사유: {reason}")
-                except discord.NotFound:
-                    banned_list.append(f"닉네임: 알 수 없음, ID: {user_id}, 사유: {reason}")
-            
-            banned_users = "\n".join(banned_list)
-            embed = discord.Embed(title="차단된 유저 목록", description=banned_users, color=discord.Color.blue())
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+        async def format_rows(rows):
+            names = await resolve_names([user_id for user_id, reason in rows])
+            return [f"닉네임: {names[user_id] or '알 수 없음'}, ID: {user_id}, 사유: {reason}" for user_id, reason in rows]
+
+        view = ListView("차단된 유저 목록", client.store.page_banlist, format_rows)
+        embed, found = await view.render()
+        if found:
+            await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
         else:
             embed = discord.Embed(title="알림", description="차단된 유저가 없습니다.", color=discord.Color.blue())
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
     elif option == "admins":
-        admin_users = [interaction.guild.get_member(admin_id) for admin_id in load_config().get("admins", [])]
+        admin_users = [interaction.guild.get_member(admin_id) for admin_id in (await load_config()).get("admins", [])]
         admin_list = "\n".join([user.name for user in admin_users if user is not None])
         if admin_list:
             embed = discord.Embed(title="총관리자 목록", description=admin_list, color=discord.Color.blue())
@@ -431,7 +945,48 @@ async def list_info(interaction: discord.Interaction, option: str):
         embed = discord.Embed(title="ERROR", description="유효하지 않은 옵션입니다. '라이센스', '유저', '차단', '총관리자' 중 하나를 선택하세요.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@client.tree.command(name="대량생성", description="라이센스 키를 대량으로 만들어서 키 풀에 추가합니다.")
+@timed()
+@app_commands.describe(count="만들 키 개수 (최대 100000)")
+@access_check(admin=True)
+async def bulk_create_license(interaction: discord.Interaction, count: app_commands.Range[int, 1, 100000]):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    keys = await run_io(generate_keys, count, frozenset(client.key_pool.members))
+    # 이미 발급된 키와 겹치는 것만 다시 만듦
+    while True:
+        taken = await client.store.assigned_licenses(keys)
+        if not taken:
+            break
+        keys = [key for key in keys if key not in taken]
+        keys += await run_io(generate_keys, len(taken), frozenset(client.key_pool.members) | frozenset(keys) | taken)
+    await client.key_pool.add(keys)
+
+    file = discord.File(io.BytesIO(''.join(key + '\n' for key in keys).encode('ascii')), filename="licenses.txt")
+    embed = discord.Embed(title="SUCCESS", description=f"{len(keys)}개의 라이센스를 만들었습니다.\n남은 키 풀: {len(client.key_pool)}개", color=discord.Color.green())
+    await interaction.followup.send(embed=embed, file=file, ephemeral=True)
+
+@client.tree.command(name="조회", description="라이센스 키의 주인을 확인합니다.")
+@timed()
+@app_commands.describe(license="확인할 라이센스 키")
+@access_check(admin=True)
+async def lookup_license(interaction: discord.Interaction, license: str):
+    user_info = await client.store.find_by_license(license.strip().upper())
+    if not user_info:
+        embed = discord.Embed(title="ERROR", description="해당 라이센스를 가진 유저가 없습니다.", color=discord.Color.red())
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+
+    embed = discord.Embed(title="라이센스 조회", color=discord.Color.blue())
+    embed.add_field(name="**유저 아이디**", value=user_info['user_id'])
+    embed.add_field(name="**유저 닉네임**", value=user_info.get('username'))
+    embed.add_field(name="**차단 여부**", value="차단됨" if await is_banned(int(user_info['user_id'])) else "차단되지 않음")
+    embed.add_field(name="**라이센스**", value=user_info.get('license'))
+    embed.add_field(name="**플랜**", value=user_info.get('plan'))
+    embed.add_field(name="**만료일**", value=user_info.get('expiry_date') or '없음')
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @client.tree.command(name="관리", description="유저의 라이센스, 플랜, 만료일을 관리합니다.")
+@timed()
 @app_commands.describe(user="관리할 유저", action="수행할 작업", action_value="설정할 값")
 @app_commands.choices(action=[
     app_commands.Choice(name="라이센스변경", value="license_change"),
@@ -441,45 +996,39 @@ async def list_info(interaction: discord.Interaction, option: str):
     app_commands.Choice(name="플랜변경(Premium)", value="plan_premium"),
     app_commands.Choice(name="만료일변경", value="expiry_change")
 ])
+@access_check(admin=True)
 async def manage_user(interaction: discord.Interaction, user: discord.User, action: str, action_value: str = None):
-    if not is_admin(interaction.user.id) and interaction.user.id != client.admin_id:
-        embed = discord.Embed(title="ERROR", description="당신은 이 명령어를 사용할 권한이 없습니다.", color=discord.Color.red())
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
-
-    users = load_users()
-    if user.id not in users:
+    if not await get_user_info(user.id):
         embed = discord.Embed(title="ERROR", description="해당 유저는 가입되어 있지 않습니다.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
 
-    user_info = users[user.id]
-
     if action == "license_change":
-        new_license = generate_license()
-        user_info['license'] = new_license
+        new_license = await issue_license(user.id)
+        client.expiry.schedule(user.id, (await get_user_info(user.id)).get('expiry_date'))
         embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 라이센스가 변경되었습니다: {new_license}", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
     elif action == "license_delete":
-        user_info['license'] = ''
+        await update_user(user.id, license='')
         embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 라이센스가 삭제되었습니다.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
     elif action == "plan_free":
-        user_info['plan'] = "free"
+        await update_user(user.id, plan="free")
         embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 플랜이 Free로 변경되었습니다.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
     elif action == "plan_standard":
-        user_info['plan'] = "standard"
+        await update_user(user.id, plan="standard")
         embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 플랜이 Standard로 변경되었습니다.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
     elif action == "plan_premium":
-        user_info['plan'] = "premium"
+        await update_user(user.id, plan="premium")
         embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 플랜이 Premium로 변경되었습니다.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
     elif action == "expiry_change":
         try:
             new_expiry = datetime.strptime(action_value, "%Y%m%d").strftime("%Y-%m-%d")
-            user_info['expiry_date'] = new_expiry
+            await update_user(user.id, expiry_date=new_expiry)
+            client.expiry.schedule(user.id, new_expiry)
             embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 만료일이 변경되었습니다: {new_expiry}", color=discord.Color.green())
             await interaction.response.send_message(embed=embed, ephemeral=True)
         except ValueError:
@@ -489,38 +1038,30 @@ async def manage_user(interaction: discord.Interaction, user: discord.User, acti
         embed = discord.Embed(title="ERROR", description="유효하지 않은 작업입니다.", color=discord.Color.red())
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    save_users(users)
-
 class MainView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
 
-    @discord.ui.button(label="가입", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="가입", style=discord.ButtonStyle.primary, custom_id="panel:register")
+    @timed()
+    @access_check(ban=True)
     async def register_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         user_id = interaction.user.id
-        if is_banned(user_id):
-            embed = discord.Embed(title="ERROR", description="BOT Service 에서 차단된 유저입니다.", color=discord.Color.red())
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
-
-        if get_user_info(user_id):
+        if interaction.extras['access'].registered:
             embed = discord.Embed(title="ERROR", description="이미 가입된 사용자입니다.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        add_user(user_id, interaction.user.name)
+        await add_user(user_id, interaction.user.name)
         embed = discord.Embed(title="SUCCESS", description="가입이 완료되었습니다. 이제 명령어를 사용할 수 있습니다.", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    @discord.ui.button(label="생성", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="생성", style=discord.ButtonStyle.primary, custom_id="panel:create_license")
+    @timed()
+    @access_check(ban=True)
     async def create_license_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         user_id = interaction.user.id
-        if is_banned(user_id):
-            embed = discord.Embed(title="ERROR", description="BOT Service 에서 차단된 유저입니다.", color=discord.Color.red())
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
-
-        user_info = get_user_info(user_id)
+        user_info = interaction.extras['access'].user_info
         if not user_info:
             embed = discord.Embed(title="ERROR", description=f"가입되지 않은 사용자입니다.\n /가입 명령어를 사용하여 가입하십시오.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -531,29 +1072,29 @@ class MainView(discord.ui.View):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        license_code = generate_license()
         plan = "free"
         expiry_date = (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
         
-        user_info['license'] = license_code
-        user_info['plan'] = plan
-        user_info['expiry_date'] = expiry_date
-        save_users({user_id: user_info})
+        license_code = await issue_license(user_id, plan=plan, expiry_date=expiry_date)
+        client.expiry.schedule(user_id, expiry_date)
         
         embed = discord.Embed(title="SUCCESS", description=f"새로운 라이센스가 생성되었습니다\n ```{license_code}```", color=discord.Color.green())
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    @discord.ui.button(label="내 정보", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="내 정보", style=discord.ButtonStyle.primary, custom_id="panel:my_info")
+    @timed()
+    @access_check()
     async def my_info_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         user_id = interaction.user.id
-        user_info = get_user_info(user_id)
+        access = interaction.extras['access']
+        user_info = access.user_info
         
         if not user_info:
             embed = discord.Embed(title="ERROR", description="가입되지 않은 사용자입니다.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
         
-        banned_status = "차단됨" if user_info.get('banned') == 'True' else "차단되지 않음"
+        banned_status = "차단됨" if access.banned else "차단되지 않음"
         license_info = user_info.get('license', '라이센스 없음')
         plan = user_info.get('plan', '없음')
         expiry_date = user_info.get('expiry_date', '없음')
@@ -569,23 +1110,22 @@ class MainView(discord.ui.View):
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    @discord.ui.button(label="관리", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="관리", style=discord.ButtonStyle.primary, custom_id="panel:manage")
+    @timed()
+    @access_check()
     async def manage_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if is_admin(interaction.user.id) or interaction.user.id == client.admin_id:
+        if interaction.extras['access'].admin:
             await interaction.response.send_message("관리 옵션을 선택하세요:", view=ManageView(), ephemeral=True)
         else:
             embed = discord.Embed(title="ERROR", description="관리 권한이 없습니다.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    @discord.ui.button(label="탈퇴", style=discord.ButtonStyle.danger)
+    @discord.ui.button(label="탈퇴", style=discord.ButtonStyle.danger, custom_id="panel:unregister")
+    @timed()
+    @access_check(ban=True)
     async def unregister_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         user_id = interaction.user.id
-        if is_banned(user_id):
-            embed = discord.Embed(title="ERROR", description="BOT Service에서 차단된 유저입니다.", color=discord.Color.red())
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            return
-
-        if not get_user_info(user_id):
+        if not interaction.extras['access'].registered:
             embed = discord.Embed(title="ERROR", description="가입되지 않은 사용자입니다.", color=discord.Color.red())
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
@@ -600,7 +1140,7 @@ class MainView(discord.ui.View):
             embed.description = "시간이 초과되었습니다. 다시 시도해주세요."
             embed.color = discord.Color.red()
         elif view.value:
-            remove_user(user_id)
+            await remove_user(user_id)
             embed.title = "SUCCESS"
             embed.description = "탈퇴가 완료되었습니다. 모든 라이센스가 삭제되었습니다.\n저희 서비스를 이용해주셔서 감사합니다."
             embed.color = discord.Color.green()
@@ -611,41 +1151,69 @@ class MainView(discord.ui.View):
 
         await interaction.edit_original_response(embed=embed, view=None)
 
+# 관리 패널 버튼 custom_id -> (모달 제목, 작업)
+MODAL_ACTIONS = {
+    "manage:license_change": ("라이센스 변경", "license_change"),
+    "manage:license_delete": ("라이센스 삭제", "license_delete"),
+    "manage:expiry_change": ("만료일 변경", "expiry_change"),
+    "plan:free": ("플랜 변경 (Free)", "plan_free"),
+    "plan:standard": ("플랜 변경 (Standard)", "plan_standard"),
+    "plan:premium": ("플랜 변경 (Premium)", "plan_premium"),
+}
+
+async def open_action_modal(interaction: discord.Interaction, button: discord.ui.Button):
+    title, action = MODAL_ACTIONS[button.custom_id]
+    await interaction.response.send_modal(UserInputModal(title, action))
+
 class ManageView(discord.ui.View):
     def __init__(self):
-        super().__init__()
+        super().__init__(timeout=None)
 
-    @discord.ui.button(label="라이센스 변경", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="라이센스 변경", style=discord.ButtonStyle.secondary, custom_id="manage:license_change")
+    @timed()
+    @access_check(admin=True)
     async def change_license_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(UserInputModal("라이센스 변경", "license_change"))
+        await open_action_modal(interaction, button)
 
-    @discord.ui.button(label="라이센스 삭제", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="라이센스 삭제", style=discord.ButtonStyle.secondary, custom_id="manage:license_delete")
+    @timed()
+    @access_check(admin=True)
     async def delete_license_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(UserInputModal("라이센스 삭제", "license_delete"))
+        await open_action_modal(interaction, button)
 
-    @discord.ui.button(label="플랜 변경", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="플랜 변경", style=discord.ButtonStyle.secondary, custom_id="manage:plan")
+    @timed()
+    @access_check(admin=True)
     async def change_plan_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message("플랜을 선택하세요:", view=PlanView(), ephemeral=True)
 
-    @discord.ui.button(label="만료일 변경", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="만료일 변경", style=discord.ButtonStyle.secondary, custom_id="manage:expiry_change")
+    @timed()
+    @access_check(admin=True)
     async def change_expiry_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(UserInputModal("만료일 변경", "expiry_change"))
+        await open_action_modal(interaction, button)
 
 class PlanView(discord.ui.View):
     def __init__(self):
-        super().__init__()
+        super().__init__(timeout=None)
 
-    @discord.ui.button(label="Free", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="Free", style=discord.ButtonStyle.secondary, custom_id="plan:free")
+    @timed()
+    @access_check(admin=True)
     async def free_plan_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(UserInputModal("플랜 변경 (Free)", "plan_free"))
+        await open_action_modal(interaction, button)
 
-    @discord.ui.button(label="Standard", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="Standard", style=discord.ButtonStyle.secondary, custom_id="plan:standard")
+    @timed()
+    @access_check(admin=True)
     async def standard_plan_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(UserInputModal("플랜 변경 (Standard)", "plan_standard"))
+        await open_action_modal(interaction, button)
 
-    @discord.ui.button(label="Premium", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="Premium", style=discord.ButtonStyle.secondary, custom_id="plan:premium")
+    @timed()
+    @access_check(admin=True)
     async def premium_plan_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(UserInputModal("플랜 변경 (Premium)", "plan_premium"))
+        await open_action_modal(interaction, button)
 
 class UserInputModal(discord.ui.Modal):
     def __init__(self, title: str, action: str):
@@ -676,6 +1244,7 @@ class UserInputModal(discord.ui.Modal):
             )
             self.add_item(self.user_input)
 
+    @timed()
     async def on_submit(self, interaction: discord.Interaction):
         try:
             if self.action == "expiry_change":
@@ -685,32 +1254,29 @@ class UserInputModal(discord.ui.Modal):
                 user_id = int(self.user_input.value)
             
             user = await interaction.client.fetch_user(user_id)
-            users = load_users()
             
-            if user.id not in users:
+            if not await get_user_info(user.id):
                 embed = discord.Embed(title="ERROR", description="해당 유저는 가입되어 있지 않습니다.", color=discord.Color.red())
                 await interaction.response.send_message(embed=embed, ephemeral=True)
                 return
 
-            user_info = users[user.id]
-
             if self.action == "license_change":
-                new_license = generate_license()
-                user_info['license'] = new_license
+                new_license = await issue_license(user.id)
+                client.expiry.schedule(user.id, (await get_user_info(user.id)).get('expiry_date'))
                 embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 라이센스가 변경되었습니다: {new_license}", color=discord.Color.green())
             elif self.action == "license_delete":
-                user_info['license'] = ''
+                await update_user(user.id, license='')
                 embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 라이센스가 삭제되었습니다.", color=discord.Color.green())
             elif self.action.startswith("plan_"):
                 plan = self.action.split("_")[1]
-                user_info['plan'] = plan
+                await update_user(user.id, plan=plan)
                 embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 플랜이 {plan.capitalize()}로 변경되었습니다.", color=discord.Color.green())
             elif self.action == "expiry_change":
                 new_expiry_date = datetime.strptime(new_expiry, "%Y%m%d").strftime("%Y-%m-%d")
-                user_info['expiry_date'] = new_expiry_date
+                await update_user(user.id, expiry_date=new_expiry_date)
+                client.expiry.schedule(user.id, new_expiry_date)
                 embed = discord.Embed(title="SUCCESS", description=f"{user.name}의 만료일이 변경되었습니다: {new_expiry_date}", color=discord.Color.green())
 
-            save_users(users)
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
         except ValueError:
@@ -722,8 +1288,10 @@ class UserInputModal(discord.ui.Modal):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             
 @client.tree.command(name="패널", description="관리 패널을 표시합니다.")
+@timed()
 async def show_panel(interaction: discord.Interaction):
     embed = discord.Embed(title="관리 패널", description="원하는 작업을 선택하세요.", color=discord.Color.blue())
-    await interaction.response.send_message(embed=embed, view=MainView())
+    await interaction.response.send_message(embed=embed, view=client.main_view)
 
-client.run('토큰')
+if __name__ == "__main__":
+    client.run('토큰')
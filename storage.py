@@ -0,0 +1,1316 @@
+import asyncio
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from licenses import BloomFilter, write_revocation_file, PLANS, PLAN_CODES
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # 윈도우에는 없어서 프로세스 간 잠금 없이 동작함
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None # 없으면 CachedFile 은 매번 stat 으로 확인함
+
+USER_FIELDS = ['user_id', 'username', 'license', 'plan', 'expiry_date', 'created']
+BAN_FIELDS = ['user_id', 'reason']
+
+# 파일 입출력은 이벤트 루프가 아니라 이 스레드들에서 처리함
+io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='storage-io')
+_file_locks = {}
+
+def file_lock(path):
+    # 같은 파일에 쓰는 작업끼리만 순서대로 처리하고 다른 파일은 동시에 처리함
+    lock = _file_locks.get(path)
+    if lock is None:
+        lock = _file_locks[path] = asyncio.Lock()
+    return lock
+
+async def run_io(func, *args):
+    name = getattr(func, '__name__', 'call')
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(io_executor, func, *args)
+    finally:
+        metrics.inc('storage_ops_total', name)
+        metrics.observe(f'storage.{name}', time.perf_counter() - start)
+
+def count_bytes(name, path):
+    # 파일 읽기/쓰기 바이트 수를 metrics 에 기록함
+    metrics.inc(name, os.path.basename(path), os.path.getsize(path))
+
+async def run_locked_io(path, func, *args):
+    async with file_lock(path):
+        return await run_io(func, *args)
+
+@contextmanager
+def process_lock(path, exclusive=True):
+    # 다른 프로세스 (봇 여러 개, 관리 스크립트) 와 같은 파일을 쓸 때 거는 fcntl 잠금, path + '.lock' 파일에 걸림
+    with open(path + '.lock', 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def atomic_write(path, write, encoding=None, newline=None):
+    # 같은 폴더의 임시 파일에 쓰고 fsync 한 다음 교체해서 읽는 쪽은 항상 완성된 파일만 보게 함
+    # 다른 프로세스와 겹치지 않게 잠금을 잡고 씀
+    with process_lock(path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding=encoding, newline=newline) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if hasattr(os, 'O_DIRECTORY'):
+            # 교체한 것 자체도 디스크에 남도록 폴더도 fsync 함
+            fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    count_bytes('storage_bytes_written_total', path)
+
+def locked_read(path, read, encoding=None, newline=None):
+    # read(f) 결과를 돌려줌, 읽는 동안에는 다른 프로세스가 저장하지 못함
+    with process_lock(path, exclusive=False):
+        count_bytes('storage_bytes_read_total', path)
+        with open(path, 'r', encoding=encoding, newline=newline) as f:
+            return read(f)
+
+def file_signature(path):
+    # 내용이 바뀌면 셋 중 하나는 바뀜, atomic_write 는 파일을 교체하니까 inode 가 바뀜
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+class CachedFile:
+    # 파일을 읽어서 read(f) 결과를 들고 있다가, 파일이 바뀌었을 때만 다시 읽음
+    # 손으로 고쳐도 다음 호출에서 바로 반영되고, 안 바뀌었으면 stat 한 번 (FileWatcher 를 쓰면 그것도 없이) 으로 끝남
+    def __init__(self, path, read, encoding=None, newline=None):
+        self.path = path
+        self.read = read
+        self.encoding = encoding
+        self.newline = newline
+        self.data = None
+        self.signature = None
+        self.loaded = False
+        self.watcher = None
+        self.dirty = True
+
+    def changed(self):
+        if self.watcher is not None and self.watcher.running:
+            return self.dirty or not self.loaded
+        return not self.loaded or file_signature(self.path) != self.signature
+
+    def reload(self):
+        # 읽기 전에 stat 해둬야 읽는 도중에 바뀐 것도 다음 호출에서 다시 읽음
+        self.dirty = False
+        self.signature = file_signature(self.path)
+        self.data = locked_read(self.path, self.read, self.encoding, self.newline)
+        self.loaded = True
+        metrics.inc('cache_reloads_total', os.path.basename(self.path))
+        return self.data
+
+    def get(self):
+        if self.changed():
+            return self.reload()
+        return self.data
+
+class FileWatcher:
+    # 리눅스에서 inotify_simple 패키지가 있으면 폴더를 감시해서 파일이 바뀌었을 때만 CachedFile 에 알려줌
+    # atomic_write 는 파일을 교체하니까 파일이 아니라 폴더를 감시함
+    def __init__(self):
+        self.inotify = None
+        self.directories = {} # wd -> 폴더
+        self.files = {} # (폴더, 파일 이름) -> [CachedFile]
+        self.running = False
+
+    def watch(self, cached):
+        if INotify is None:
+            return
+        if self.inotify is None:
+            self.inotify = INotify()
+        directory = os.path.dirname(os.path.abspath(cached.path))
+        if directory not in self.directories.values():
+            mask = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+                    | inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.ATTRIB)
+            self.directories[self.inotify.add_watch(directory, mask)] = directory
+        self.files.setdefault((directory, os.path.basename(cached.path)), []).append(cached)
+        cached.watcher = self
+
+    def start(self):
+        if self.inotify is None:
+            return
+        asyncio.get_running_loop().add_reader(self.inotify.fd, self._on_events)
+        # 감시를 시작하기 전에 바뀐 것은 모르니까 한 번은 다시 읽게 함
+        for files in self.files.values():
+            for cached in files:
+                cached.dirty = True
+        self.running = True
+
+    def _on_events(self):
+        for event in self.inotify.read(timeout=0):
+            if event.mask & inotify_flags.Q_OVERFLOW:
+                for files in self.files.values():
+                    for cached in files:
+                        cached.dirty = True
+                continue
+            for cached in self.files.get((self.directories.get(event.wd), event.name), ()):
+                cached.dirty = True
+
+    def stop(self):
+        if self.running:
+            asyncio.get_running_loop().remove_reader(self.inotify.fd)
+            self.running = False
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+def write_csv(path, fieldnames, rows, encoding=None):
+    def write(f):
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    atomic_write(path, write, encoding=encoding, newline='')
+
+def _write_export_batch(text, writer, batch):
+    if writer is not None:
+        writer.writerows(batch)
+    else:
+        text.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch))
+
+async def export_rows(rows, fieldnames, fileobj, fmt='csv', batch_size=1000):
+    # rows (async generator) 를 batch_size 개씩 모아서 스레드에서 gzip 으로 압축하며 fileobj 에 씀
+    # 한 번에 batch_size 개만 메모리에 들고 있어서 행이 많아도 메모리를 거의 안 씀
+    text = io.TextIOWrapper(gzip.GzipFile(fileobj=fileobj, mode='wb'), encoding='utf-8', newline='')
+    writer = csv.DictWriter(text, fieldnames=fieldnames, extrasaction='ignore') if fmt == 'csv' else None
+    count = 0
+    batch = []
+    try:
+        if writer is not None:
+            await run_io(writer.writeheader)
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await run_io(_write_export_batch, text, writer, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            await run_io(_write_export_batch, text, writer, batch)
+            count += len(batch)
+    finally:
+        await run_io(text.close)
+    return count
+
+def csv_imported(database):
+    # csv 를 옮겨간 sqlite 데이터베이스가 있는지, 그 뒤로는 csv 가 최신이 아님
+    if not os.path.exists(database):
+        return False
+    conn = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    try:
+        return conn.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone() is not None
+    except sqlite3.OperationalError:
+        # meta 테이블이 생기기 전 파일
+        return False
+    finally:
+        conn.close()
+
+def read_json(path):
+    return locked_read(path, json.load)
+
+def write_json(path, data):
+    atomic_write(path, lambda f: json.dump(data, f, indent=4))
+
+def plan_code(plan):
+    # 비어있으면 'None' 으로 봄
+    try:
+        return PLAN_CODES[plan or 'None']
+    except KeyError:
+        raise ValueError(f"알 수 없는 플랜입니다: {plan}") from None
+
+def date_ordinal(text):
+    # 'YYYY-MM-DD' -> date.toordinal(), 없으면 0
+    return date.fromisoformat(text).toordinal() if text else 0
+
+# 저장된 값용, csv 를 손으로 고쳐서 잘못된 값이 들어있어도 그 줄 하나 때문에 로드나 /분석 이 멈추지 않게
+# 경고만 출력하고 'None' 플랜 (0) / 만료일 없음 (0) 으로 봄
+def _stored_plan_code(plan):
+    try:
+        return plan_code(plan)
+    except ValueError as e:
+        print(f"{e} 'None' 으로 봅니다.")
+        return 0
+
+def _stored_date_ordinal(text):
+    try:
+        return date_ordinal(text)
+    except (ValueError, TypeError):
+        print(f"잘못된 만료일입니다: {text} 만료일이 없는 것으로 봅니다.")
+        return 0
+
+class UserRecord:
+    # users.csv 한 줄을 문자열 dict 대신 들고 있는 객체
+    # 아이디는 int, 플랜은 PLANS 의 번호, 만료일은 date.toordinal() (없으면 0), 가입 시각은 유닉스 시간 (모르면 0),
+    # 차단 여부는 bool 로 들고 있어서 dict 보다 유저 한 명당 메모리를 몇 배 덜 쓰고 "이번 주 만료" 같은 조건도 정수 비교로 끝남
+    __slots__ = ('user_id', 'username', 'license', 'plan', 'expiry', 'created', 'banned')
+
+    def __init__(self, user_id, username='', license='', plan=0, expiry=0, created=0, banned=False):
+        self.user_id = user_id
+        self.username = username
+        self.license = license
+        self.plan = plan
+        self.expiry = expiry
+        self.created = created
+        self.banned = banned
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(int(row['user_id']), row.get('username') or '', row.get('license') or '',
+                   _stored_plan_code(row.get('plan')), _stored_date_ordinal(row.get('expiry_date')),
+                   int(row.get('created') or 0), row.get('banned') == 'True')
+
+    def update(self, fields):
+        # update() 에 넘기는 필드 이름과 값 ('plan': 'free', 'expiry_date': 'YYYY-MM-DD') 을 그대로 받음
+        for key, value in fields.items():
+            if key == 'plan':
+                self.plan = _stored_plan_code(value)
+            elif key == 'expiry_date':
+                self.expiry = _stored_date_ordinal(value)
+            elif key in ('username', 'license'):
+                setattr(self, key, value or '')
+            elif key == 'created':
+                self.created = int(value or 0)
+            elif key == 'banned':
+                self.banned = value in (True, 'True')
+
+    @property
+    def plan_name(self):
+        return PLANS[self.plan]
+
+    @property
+    def expiry_date(self):
+        return date.fromordinal(self.expiry).isoformat() if self.expiry else ''
+
+    def matches(self, plan=None, expires_before=0, licensed=False):
+        # plan 은 PLANS 번호, expires_before 는 toordinal() 값
+        if licensed and not self.license:
+            return False
+        if plan is not None and self.plan != plan:
+            return False
+        if expires_before and not 0 < self.expiry <= expires_before:
+            return False
+        return True
+
+    def to_row(self, fields=USER_FIELDS):
+        # csv 에 쓰거나 명령어에 넘기는 dict, 부르는 쪽에서 고쳐도 원래 객체는 바뀌지 않음
+        row = {
+            'user_id': self.user_id,
+            'username': self.username,
+            'license': self.license,
+            'plan': self.plan_name,
+            'expiry_date': self.expiry_date
+        }
+        if 'created' in fields:
+            row['created'] = self.created
+        if 'banned' in fields:
+            row['banned'] = str(self.banned)
+        return row
+
+class StorageBackend:
+    # 저장소 공통 인터페이스, newbot.py 는 이 메소드들만 사용함
+    async def load(self):
+        raise NotImplementedError
+
+    async def get(self, user_id):
+        raise NotImplementedError
+
+    async def is_banned(self, user_id):
+        raise NotImplementedError
+
+    async def find_by_license(self, license):
+        raise NotImplementedError
+
+    async def lookup(self, user_id):
+        # 유저 정보와 차단 여부를 한 번에 가져옴
+        raise NotImplementedError
+
+    async def iter_users(self):
+        raise NotImplementedError
+        yield
+
+    async def iter_banlist(self):
+        raise NotImplementedError
+        yield
+
+    async def page_users(self, offset, limit, plan=None, expires_before=None, licensed=False):
+        # 조건에 맞는 유저를 offset 부터 limit 개만 가져옴, expires_before 는 'YYYY-MM-DD'
+        raise NotImplementedError
+
+    async def page_banlist(self, offset, limit):
+        raise NotImplementedError
+
+    async def user_columns(self):
+        # 통계용 열을 array 로 돌려줌 (analytics.summarize 에 넘김)
+        # plan: 유저마다 PLANS 번호, expiry: 만료일이 있는 유저의 만료일 (toordinal), created: 가입 시각을 아는 유저의 가입 시각 (유닉스 시간)
+        # licensed: 라이센스가 있는 유저 수, <열>_weights 가 있으면 그 열의 값마다 몇 명인지 (같은 값을 묶어서 줄 때)
+        raise NotImplementedError
+
+    async def license_expiries(self):
+        # 라이센스와 만료일이 둘 다 있는 유저만 (만료일 'YYYY-MM-DD', user_id) 목록으로 돌려줌, 만료일 순으로 정렬됨
+        raise NotImplementedError
+
+    async def register(self, user_id, username):
+        raise NotImplementedError
+
+    async def unregister(self, user_id):
+        raise NotImplementedError
+
+    async def update(self, user_id, **fields):
+        raise NotImplementedError
+
+    async def update_many(self, user_ids, **fields):
+        # 여러 유저의 같은 필드를 한 번에 바꿈, 없는 유저는 건너뜀
+        raise NotImplementedError
+
+    async def assign_license(self, user_id, license, **fields):
+        # 다른 유저가 이미 가진 키면 아무것도 바꾸지 않고 False 를 돌려줌
+        raise NotImplementedError
+
+    async def assigned_licenses(self, licenses):
+        # licenses 중에서 이미 누군가 가지고 있는 키만 set 으로 돌려줌
+        raise NotImplementedError
+
+    async def user_licenses(self, user_ids):
+        # user_ids 중에서 라이센스가 있는 유저만 {user_id: 라이센스} 로 한 번에 돌려줌
+        raise NotImplementedError
+
+    async def ban(self, user_id, reason):
+        raise NotImplementedError
+
+    async def unban(self, user_id):
+        raise NotImplementedError
+
+    async def ban_many(self, entries):
+        # (user_id, reason) 여러 개를 한 번에 저장하고 새로 차단된 수를 돌려줌, 이미 차단된 유저는 건너뜀
+        raise NotImplementedError
+
+    async def unban_many(self, user_ids):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class UserStore(StorageBackend):
+    # users.csv, banlist.csv 를 시작할 때 한 번만 읽고 이후에는 메모리에서 처리함
+    # journal_file 이 없으면 변경사항을 flush_delay 초 동안 모아서 csv 전체를 저장하고
+    # journal_file 이 있으면 변경사항 한 줄씩만 저널에 추가한 뒤 compact_size 를 넘을 때 csv 로 합침
+    def __init__(self, users_csv, banlist_csv, flush_delay=1.0, journal_file=None, compact_size=1024 * 1024):
+        self.users_csv = users_csv
+        self.banlist_csv = banlist_csv
+        self.flush_delay = flush_delay
+        self.journal_file = journal_file
+        self.compact_size = compact_size
+        self.users = {}
+        self.banlist = {}
+        self.licenses = {}
+        self._dirty = set()
+        self._flush_task = None
+        self._journal = None
+        self._journal_size = 0
+        self._compact_task = None
+
+    async def load(self):
+        await run_io(self._load)
+
+    def _load(self):
+        self.users = {}
+        self.banlist = {}
+        self.licenses = {}
+        if os.path.exists(self.users_csv):
+            count_bytes('storage_bytes_read_total', self.users_csv)
+            with open(self.users_csv, 'r') as f:
+                for row in csv.DictReader(f):
+                    record = UserRecord.from_row(row)
+                    self.users[record.user_id] = record
+                    if record.license:
+                        self.licenses[record.license] = record.user_id
+        if os.path.exists(self.banlist_csv):
+            count_bytes('storage_bytes_read_total', self.banlist_csv)
+            with open(self.banlist_csv, 'r', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    self.banlist[int(row['user_id'])] = row['reason']
+        if self.journal_file:
+            # 압축 도중 꺼졌으면 .old 가 남아있으니 그것부터 다시 적용함
+            for path in (self.journal_file + '.old', self.journal_file):
+                self._replay(path)
+            self._journal_size = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+
+    def _replay(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 마지막 줄이 쓰다가 끊긴 경우
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        op = record['op']
+        user_id = record['user_id']
+        if op == 'register':
+            self._unindex(user_id)
+            self.users[user_id] = UserRecord.from_row(record['row'])
+            self._index(user_id)
+        elif op == 'update':
+            if user_id in self.users:
+                if 'license' in record['fields']:
+                    self._unindex(user_id)
+                self.users[user_id].update(record['fields'])
+                self._index(user_id)
+        elif op == 'unregister':
+            self._unindex(user_id)
+            self.users.pop(user_id, None)
+        elif op == 'ban':
+            self.banlist[user_id] = record['reason']
+        elif op == 'unban':
+            self.banlist.pop(user_id, None)
+
+    def _index(self, user_id):
+        # 라이센스 -> 유저 아이디 인덱스, users 를 바꿀 때마다 같이 맞춰줌
+        license = self.users[user_id].license
+        if license:
+            self.licenses[license] = user_id
+
+    def _unindex(self, user_id):
+        record = self.users.get(user_id)
+        if record and record.license and self.licenses.get(record.license) == user_id:
+            del self.licenses[record.license]
+
+    def _row(self, user_id):
+        record = self.users.get(user_id)
+        return record.to_row() if record is not None else {}
+
+    async def get(self, user_id):
+        return self._row(user_id)
+
+    async def is_banned(self, user_id):
+        return user_id in self.banlist
+
+    async def lookup(self, user_id):
+        return self._row(user_id), user_id in self.banlist
+
+    async def find_by_license(self, license):
+        user_id = self.licenses.get(license)
+        if user_id is None:
+            return {}
+        return self._row(user_id)
+
+    async def iter_users(self):
+        for record in list(self.users.values()):
+            yield record.to_row()
+
+    async def iter_banlist(self):
+        for user_id, reason in list(self.banlist.items()):
+            yield user_id, reason
+
+    async def page_users(self, offset, limit, plan=None, expires_before=None, licensed=False):
+        # 조건은 한 번만 정수로 바꿔두고 유저마다 정수 비교만 함, dict 는 돌려줄 limit 개만 만듦
+        code = plan_code(plan) if plan else None
+        before = date_ordinal(expires_before)
+        records = (record for record in self.users.values() if record.matches(code, before, licensed))
+        return [record.to_row() for record in itertools.islice(records, offset, offset + limit)]
+
+    async def page_banlist(self, offset, limit):
+        return list(itertools.islice(self.banlist.items(), offset, offset + limit))
+
+    async def user_columns(self):
+        # 목록만 복사해두고 열은 스레드에서 만듦
+        return await run_io(self._user_columns, list(self.users.values()))
+
+    def _user_columns(self, records):
+        return {
+            'plan': array('b', [record.plan for record in records]),
+            'expiry': array('q', [record.expiry for record in records if record.expiry]),
+            'created': array('q', [record.created for record in records if record.created]),
+            'licensed': sum(1 for record in records if record.license)
+        }
+
+    async def license_expiries(self):
+        return await run_io(self._license_expiries, list(self.users.values()))
+
+    def _license_expiries(self, records):
+        return sorted((record.expiry_date, record.user_id) for record in records if record.license and record.expiry)
+
+    async def register(self, user_id, username):
+        row = {
+            'user_id': user_id,
+            'username': username,
+            'license': '',
+            'plan': 'None',
+            'expiry_date': '',
+            'created': int(time.time())
+        }
+        await self._commit({'op': 'register', 'user_id': user_id, 'row': row}, 'users')
+
+    async def unregister(self, user_id):
+        if user_id in self.users:
+            await self._commit({'op': 'unregister', 'user_id': user_id}, 'users')
+
+    async def update(self, user_id, **fields):
+        if user_id in self.users:
+            await self._commit({'op': 'update', 'user_id': user_id, 'fields': fields}, 'users')
+
+    async def update_many(self, user_ids, **fields):
+        records = [{'op': 'update', 'user_id': user_id, 'fields': fields} for user_id in set(user_ids) if user_id in self.users]
+        await self._commit_many(records, 'users')
+
+    async def assign_license(self, user_id, license, **fields):
+        # 확인하고 반영하는 사이에 await 가 없어서 다른 명령어와 겹치지 않음
+        owner = self.licenses.get(license)
+        if owner is not None and owner != user_id:
+            return False
+        await self.update(user_id, license=license, **fields)
+        return True
+
+    async def assigned_licenses(self, licenses):
+        return {license for license in licenses if license in self.licenses}
+
+    async def user_licenses(self, user_ids):
+        records = (self.users.get(user_id) for user_id in user_ids)
+        return {record.user_id: record.license for record in records if record is not None and record.license}
+
+    async def ban(self, user_id, reason):
+        await self._commit({'op': 'ban', 'user_id': user_id, 'reason': reason}, 'banlist')
+
+    async def unban(self, user_id):
+        if user_id in self.banlist:
+            await self._commit({'op': 'unban', 'user_id': user_id}, 'banlist')
+
+    async def ban_many(self, entries):
+        records = [{'op': 'ban', 'user_id': user_id, 'reason': reason} for user_id, reason in dict(entries).items() if user_id not in self.banlist]
+        await self._commit_many(records, 'banlist')
+        return len(records)
+
+    async def unban_many(self, user_ids):
+        records = [{'op': 'unban', 'user_id': user_id} for user_id in set(user_ids) if user_id in self.banlist]
+        await self._commit_many(records, 'banlist')
+        return len(records)
+
+    async def _commit(self, record, table):
+        await self._commit_many([record], table)
+
+    async def _commit_many(self, records, table):
+        # 여러 변경을 저널 한 번 쓰기 (저널이 없으면 csv 한 번 저장) 로 처리함
+        if not records:
+            return
+        for record in records:
+            self._apply(record)
+        if self.journal_file:
+            await self._append(records)
+        else:
+            self.mark_dirty(table)
+
+    async def _append(self, records):
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        await run_locked_io(self.journal_file, self._write_journal, lines)
+        size = len(lines.encode('utf-8'))
+        self._journal_size += size
+        metrics.inc('storage_bytes_written_total', os.path.basename(self.journal_file), size)
+        if self._journal_size >= self.compact_size and self._compact_task is None:
+            self._compact_task = asyncio.get_running_loop().create_task(self._background_compact())
+
+    def _write_journal(self, line):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        self._journal.write(line)
+        self._journal.flush()
+
+    def _rotate_journal(self):
+        # 지금까지의 저널을 .old 로 돌림, 이후 변경은 새 저널에 쌓임
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        old_path = self.journal_file + '.old'
+        if os.path.exists(self.journal_file):
+            if os.path.exists(old_path):
+                # 이전 압축이 실패해서 .old 가 남아있으면 거기에 이어붙임
+                with open(old_path, 'a', encoding='utf-8') as old, open(self.journal_file, 'r', encoding='utf-8') as current:
+                    shutil.copyfileobj(current, old)
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, old_path)
+
+    def _snapshot(self):
+        # 목록만 복사하고 dict 로 바꾸는 건 스레드에서 함 (유저가 많으면 이벤트 루프가 몇 초씩 멈춤)
+        # 그 사이 바뀐 유저는 새 값으로 쓰일 수 있는데, 같은 변경이 새 저널 (저널이 없으면 다음 저장) 에도 있어서 결과는 같음
+        return list(self.users.values()), list(self.banlist.items())
+
+    def _write_users(self, records):
+        write_csv(self.users_csv, USER_FIELDS, [record.to_row() for record in records])
+
+    def _write_banlist(self, items):
+        write_csv(self.banlist_csv, BAN_FIELDS, [{'user_id': user_id, 'reason': reason} for user_id, reason in items], encoding='utf-8')
+
+    def _write_snapshot(self, users, banlist):
+        self._write_users(users)
+        self._write_banlist(banlist)
+        old_path = self.journal_file + '.old'
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    async def _background_compact(self):
+        try:
+            await self.compact()
+        finally:
+            self._compact_task = None
+
+    async def compact(self):
+        async with file_lock(self.journal_file):
+            # 저널을 돌리는 순간의 상태를 복사해둬야 스냅샷과 새 저널이 이어짐
+            await run_io(self._rotate_journal)
+            self._journal_size = 0
+            users, banlist = self._snapshot()
+        async with file_lock(self.users_csv):
+            await run_io(self._write_snapshot, users, banlist)
+
+    def mark_dirty(self, table):
+        self._dirty.add(table)
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        try:
+            await asyncio.sleep(self.flush_delay)
+        finally:
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        # 스레드에서 쓰는 동안 원본이 바뀌지 않게 목록을 복사해서 넘김 (_snapshot 과 같음)
+        dirty, self._dirty = self._dirty, set()
+        if 'users' in dirty:
+            await run_locked_io(self.users_csv, self._write_users, list(self.users.values()))
+        if 'banlist' in dirty:
+            await run_locked_io(self.banlist_csv, self._write_banlist, list(self.banlist.items()))
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._compact_task is not None:
+            await self._compact_task
+        await self.flush()
+        if self._journal is not None:
+            async with file_lock(self.journal_file):
+                self._journal.close()
+                self._journal = None
+
+class KeyPool:
+    # 미리 만들어둔 라이센스 키 목록, 파일에는 한 줄에 키 하나씩 추가하고 쓴 키는 '-키' 로 추가함
+    def __init__(self, path):
+        self.path = path
+        self.keys = deque()
+        self.members = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    async def load(self):
+        await run_locked_io(self.path, self._load)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        keys = {}
+        removed = False
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('-'):
+                    keys.pop(line[1:], None)
+                    removed = True
+                elif line:
+                    keys[line] = None
+        self.keys = deque(keys)
+        self.members = set(keys)
+        if removed:
+            # 쓴 키들은 빼고 다시 저장해서 파일이 계속 커지지 않게 함
+            keys = ''.join(key + '\n' for key in self.keys)
+            atomic_write(self.path, lambda f: f.write(keys))
+
+    def _append(self, text):
+        with open(self.path, 'a') as f:
+            f.write(text)
+
+    async def add(self, keys):
+        # 키 여러 개를 파일에 한 번에 추가함
+        await run_locked_io(self.path, self._append, ''.join(key + '\n' for key in keys))
+        self.keys.extend(keys)
+        self.members.update(keys)
+
+    async def claim(self):
+        if not self.keys:
+            return None
+        key = self.keys.popleft()
+        self.members.discard(key)
+        await run_locked_io(self.path, self._append, f'-{key}\n')
+        return key
+
+class RevocationList:
+    # 폐기된 라이센스 번호 목록 (licenses.license_id), 파일에는 한 줄에 하나씩 추가만 함
+    # 메모리에서는 Bloom 필터 뒤에 정렬된 array('Q') 를 두고, export_path 에 외부 확인용 바이너리 파일을 씀
+    def __init__(self, path, export_path=None, capacity=1 << 20, error_rate=0.001, flush_delay=1.0):
+        self.path = path
+        self.export_path = export_path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.flush_delay = flush_delay
+        self.ids = array('Q')
+        self.bloom = BloomFilter.for_capacity(capacity, error_rate)
+        self._offset = 0 # 파일에서 어디까지 읽었는지, 다른 프로세스가 추가한 줄은 refresh 에서 읽음
+        self._export_task = None
+        self._insert_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, value):
+        if value not in self.bloom:
+            return False
+        i = bisect_left(self.ids, value)
+        return i < len(self.ids) and self.ids[i] == value
+
+    async def load(self):
+        self.ids = await run_locked_io(self.path, self._load)
+        # 필터는 번호 수의 두 배까지 여유를 두고 만듦
+        while self.capacity < len(self.ids) * 2:
+            self.capacity *= 2
+        self.bloom = await run_io(self._build_bloom, self.ids, self.capacity)
+        if self.export_path is not None:
+            await self.export()
+
+    def _load(self):
+        self._offset = 0
+        return array('Q', sorted(set(self._read_new())))
+
+    def _read_new(self):
+        # 마지막으로 읽은 곳부터 끝까지 완성된 줄만 읽음
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        return [int(line) for line in data[:end].split() if line]
+
+    def _build_bloom(self, ids, capacity):
+        bloom = BloomFilter.for_capacity(capacity, self.error_rate)
+        for value in ids:
+            bloom.add(value)
+        return bloom
+
+    def _append(self, text):
+        with open(self.path, 'a') as f:
+            f.write(text)
+
+    async def add(self, value):
+        await self.add_many([value])
+
+    async def refresh(self):
+        # 여러 프로세스가 같은 파일을 쓸 때 다른 프로세스가 추가한 번호를 가져옴
+        values = await self._insert(await run_locked_io(self.path, self._read_new))
+        if values:
+            self._schedule_export()
+
+    async def add_many(self, values):
+        values = await self._insert(values)
+        if not values:
+            return
+        await run_locked_io(self.path, self._append, ''.join(f'{value}\n' for value in values))
+        self._schedule_export()
+
+    def _schedule_export(self):
+        if self.export_path is not None and self._export_task is None:
+            self._export_task = asyncio.get_running_loop().create_task(self._delayed_export())
+
+    async def _insert(self, values):
+        # 필터를 스레드에서 다시 만드는 동안 다른 추가가 끼어들면 새 필터에서 빠지므로 한 번에 하나씩 처리함
+        async with self._insert_lock:
+            values = sorted({value for value in values if value not in self})
+            if not values:
+                return values
+            if len(values) > 64:
+                # 많이 들어오면 하나씩 끼워넣는 것보다 합쳐서 다시 정렬하는게 빠름
+                self.ids = array('Q', sorted(itertools.chain(self.ids, values)))
+            else:
+                for value in values:
+                    insort(self.ids, value)
+            # 다시 만드는 동안에도 새 번호가 폐기된 걸로 보이게 지금 필터에 먼저 넣음
+            for value in values:
+                self.bloom.add(value)
+            if len(self.ids) > self.capacity:
+                while self.capacity < len(self.ids):
+                    self.capacity *= 2
+                self.bloom = await run_io(self._build_bloom, self.ids[:], self.capacity)
+            return values
+
+    async def _delayed_export(self):
+        try:
+            await asyncio.sleep(self.flush_delay)
+        finally:
+            self._export_task = None
+        await self.export()
+
+    async def export(self):
+        # 스레드에서 쓰는 동안 바뀌지 않게 복사본을 넘김
+        bloom = BloomFilter(self.bloom.size, self.bloom.hashes, bytes(self.bloom.bits))
+        await run_locked_io(self.export_path, write_revocation_file, self.export_path, bloom, self.ids[:])
+
+    async def close(self):
+        if self._export_task is not None:
+            self._export_task.cancel()
+            self._export_task = None
+            await self.export()
+
+class EventLog:
+    # 탈퇴 같은 이벤트를 '유닉스시간 유저아이디' 한 줄씩 추가만 하는 파일, 메모리에는 시각만 array('q') 로 들고 있음
+    def __init__(self, path):
+        self.path = path
+        self.times = array('q')
+        self._offset = 0 # 파일에서 어디까지 읽었는지, 다른 프로세스가 추가한 줄은 refresh 에서 읽음
+
+    def __len__(self):
+        return len(self.times)
+
+    async def load(self):
+        self._offset = 0
+        self.times = array('q', await run_locked_io(self.path, self._read_new))
+
+    async def refresh(self):
+        self.times.extend(await run_locked_io(self.path, self._read_new))
+
+    def _read_new(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        return [int(line.split()[0]) for line in data[:end].splitlines() if line]
+
+    def _append(self, text):
+        # 다른 프로세스가 추가한 줄을 읽고 나서 쓰고, 내가 쓴 줄은 다시 읽지 않게 offset 을 넘김
+        times = self._read_new()
+        with open(self.path, 'a') as f:
+            f.write(text)
+        self._offset += len(text.encode())
+        return times
+
+    async def add(self, user_id, when=None):
+        when = int(when if when is not None else time.time())
+        self.times.extend(await run_locked_io(self.path, self._append, f'{when} {user_id}\n'))
+        self.times.append(when)
+
+class NameCache:
+    # 유저 아이디 -> 닉네임, 오래 안 쓴 것부터 지우고 ttl 초가 지나면 다시 가져오게 함
+    # 없는 유저는 빈 문자열로 저장해서 매번 다시 요청하지 않게 함
+    def __init__(self, path, max_size=10000, ttl=24 * 60 * 60):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self._dirty = False
+
+    async def load(self):
+        if os.path.exists(self.path):
+            try:
+                data = await run_locked_io(self.path, read_json, self.path)
+            except json.JSONDecodeError:
+                return
+            now = time.time()
+            for user_id, (name, expires_at) in data.items():
+                if expires_at > now:
+                    self.entries[int(user_id)] = (name, expires_at)
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at <= time.time():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return name
+
+    def put(self, user_id, name):
+        self.entries[user_id] = (name, time.time() + self.ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self._dirty = True
+
+    async def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        data = {str(user_id): list(entry) for user_id, entry in self.entries.items()}
+        await run_locked_io(self.path, write_json, self.path, data)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    license TEXT NOT NULL DEFAULT '',
+    plan TEXT NOT NULL DEFAULT 'None',
+    expiry_date TEXT NOT NULL DEFAULT '',
+    created INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_license ON users(license);
+CREATE INDEX IF NOT EXISTS users_expiry_date ON users(expiry_date);
+CREATE INDEX IF NOT EXISTS users_plan ON users(plan);
+CREATE TABLE IF NOT EXISTS banlist (
+    user_id INTEGER PRIMARY KEY,
+    reason TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+SQL_USER_COLUMNS = "user_id, username, license, plan, expiry_date, created"
+SQL_GET_USER = f"SELECT {SQL_USER_COLUMNS} FROM users WHERE user_id = ?"
+SQL_LICENSE_OWNER = "SELECT user_id FROM users WHERE license = ?"
+SQL_FIND_LICENSE = f"SELECT {SQL_USER_COLUMNS} FROM users WHERE license = ?"
+SQL_PAGE_USERS = f"SELECT {SQL_USER_COLUMNS} FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?"
+SQL_OFFSET_BANLIST = "SELECT user_id, reason FROM banlist ORDER BY user_id LIMIT ? OFFSET ?"
+SQL_IS_BANNED = "SELECT 1 FROM banlist WHERE user_id = ?"
+SQL_LOOKUP = """
+SELECT EXISTS (SELECT 1 FROM banlist WHERE user_id = :user_id) AS banned, users.*
+FROM (SELECT 1) LEFT JOIN users ON users.user_id = :user_id
+"""
+SQL_PAGE_BANLIST = "SELECT user_id, reason FROM banlist WHERE user_id > ? ORDER BY user_id LIMIT ?"
+SQL_REGISTER = "INSERT OR REPLACE INTO users (user_id, username, license, plan, expiry_date, created) VALUES (?, ?, '', 'None', '', ?)"
+SQL_UNREGISTER = "DELETE FROM users WHERE user_id = ?"
+SQL_BAN = "INSERT OR REPLACE INTO banlist (user_id, reason) VALUES (?, ?)"
+SQL_UNBAN = "DELETE FROM banlist WHERE user_id = ?"
+SQL_BAN_IGNORE = "INSERT OR IGNORE INTO banlist (user_id, reason) VALUES (?, ?)"
+# expiry_date > '' 는 users_expiry_date 인덱스를 범위로 읽어서 만료일이 없는 유저는 보지 않음, 정렬도 인덱스 순서 그대로
+SQL_LICENSE_EXPIRIES = "SELECT expiry_date, user_id FROM users WHERE expiry_date > '' AND license != '' ORDER BY expiry_date"
+# 통계는 행을 하나씩 가져오면 느려서 같은 값끼리 묶어서 (값, 명수) 로 가져옴, 전부 인덱스만 읽고 끝남
+SQL_STATS_PLANS = "SELECT plan, COUNT(*) FROM users GROUP BY plan"
+SQL_STATS_UNLICENSED = "SELECT COUNT(*) FROM users WHERE license = ''"
+SQL_STATS_EXPIRY = "SELECT expiry_date, COUNT(*) FROM users WHERE expiry_date != '' GROUP BY expiry_date"
+# 가입 시각은 한 시간 단위로 묶음 (주별 집계에서 경계가 최대 한 시간 어긋남)
+SQL_STATS_CREATED = "SELECT created - created % 3600, COUNT(*) FROM users WHERE created > 0 GROUP BY created / 3600"
+
+class SqliteStore(StorageBackend):
+    # user_id, license, expiry_date 에 인덱스가 있어서 유저 수가 많아도 조회가 O(log N) 이고
+    # 시작할 때 전체를 읽지 않음, 쓰기는 연결 하나로 직렬화하고 읽기는 pool_size 개의 연결을 돌려씀
+    # WAL 이라서 여러 프로세스가 같은 파일을 같이 써도 됨 (쓰기는 sqlite 잠금으로 한 번에 하나씩)
+    def __init__(self, database, pool_size=4, users_csv=None, banlist_csv=None, page_size=500, journal_file=None):
+        self.database = database
+        self.pool_size = pool_size
+        self.users_csv = users_csv
+        self.banlist_csv = banlist_csv
+        self.journal_file = journal_file # csv 모드에서 쓰던 저널, 옮길 때 같이 반영함
+        self.page_size = page_size
+        self._pool = None
+        self._writer = None
+        self._write_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False, cached_statements=64)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    async def load(self):
+        await run_io(self._load)
+
+    def _load(self):
+        self._writer = self._connect()
+        self._writer.executescript(SQLITE_SCHEMA)
+        self._migrate()
+        self._pool = queue.Queue()
+        for _ in range(self.pool_size):
+            self._pool.put(self._connect())
+        self._import_csv()
+
+    def _migrate(self):
+        # created 열이 없던 예전 데이터베이스에 열을 추가함, 여러 프로세스가 동시에 시작해도 한 번만 추가하도록 잠금 안에서 확인함
+        with self._write_lock, self._writer:
+            self._writer.execute("BEGIN IMMEDIATE")
+            columns = {row['name'] for row in self._writer.execute("PRAGMA table_info(users)")}
+            if 'created' not in columns:
+                self._writer.execute("ALTER TABLE users ADD COLUMN created INTEGER NOT NULL DEFAULT 0")
+            self._writer.execute("CREATE INDEX IF NOT EXISTS users_created ON users(created)")
+
+    def _imported(self):
+        if self._writer.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone():
+            return True
+        # 표시를 남기기 전에 옮겨둔 데이터베이스는 데이터가 있으면 옮긴 것으로 봄
+        return bool(self._writer.execute("SELECT 1 FROM users LIMIT 1").fetchone()
+                    or self._writer.execute("SELECT 1 FROM banlist LIMIT 1").fetchone())
+
+    def _csv_state(self):
+        # UserStore 로 읽어서 저널까지 반영한 상태를 가져오고, 저널이 있으면 csv 에 합쳐서 비워둠 (다시 csv 로 돌아가도 잃지 않게)
+        store = UserStore(self.users_csv or '', self.banlist_csv or '', journal_file=self.journal_file)
+        store._load()
+        if self.journal_file and self.users_csv and self.banlist_csv:
+            if os.path.exists(self.journal_file) or os.path.exists(self.journal_file + '.old'):
+                store._rotate_journal()
+                store._write_snapshot(*store._snapshot())
+        return store
+
+    def _check_journal(self):
+        # 옮긴 뒤에 csv 모드로 실행해서 저널에 쌓인 변경은 sqlite 에 합칠 수 없으니 (어느 쪽이 최신인지 모름) 시작하지 않음
+        # 샤드 여러 개로 실행하면 sqlite 로 강제로 바뀌어서 여기서 조용히 잃어버리기 쉬움
+        if not self.journal_file:
+            return
+        if os.path.exists(self.journal_file + '.old') or (os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > 0):
+            raise RuntimeError(f"{self.journal_file} 에 sqlite 로 옮긴 뒤의 변경사항이 남아있습니다. "
+                               f"{self.database} 를 지우면 csv 와 저널을 다시 옮겨오고, 저널이 필요 없으면 지운 다음 실행하세요.")
+
+    def _import_csv(self):
+        # 처음 sqlite 로 바꿨을 때 기존 users.csv, banlist.csv 와 저널을 옮겨옴
+        # 여러 프로세스가 동시에 시작해도 한 번만 옮기도록 BEGIN IMMEDIATE 안에서 확인하고, 옮긴 뒤에는 meta 에 표시를 남김
+        # (users 가 비어있는지로 확인하면 유저가 없을 때마다 banlist.csv 를 다시 읽어서 차단 해제한 유저가 되살아남)
+        with self._write_lock, self._writer:
+            self._writer.execute("BEGIN IMMEDIATE")
+            if self._imported():
+                self._check_journal()
+            else:
+                store = self._csv_state()
+                rows = ((record.user_id, record.username, record.license, record.plan_name, record.expiry_date, record.created)
+                        for record in store.users.values())
+                self._writer.executemany(f"INSERT OR REPLACE INTO users ({SQL_USER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self._writer.executemany(SQL_BAN, store.banlist.items())
+            self._writer.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('csv_imported', ?)", (str(int(time.time())),))
+
+    @contextmanager
+    def _reader(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def _fetchone(self, sql, params):
+        with self._reader() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params):
+        with self._reader() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql, params):
+        with self._write_lock, self._writer:
+            self._writer.execute(sql, params)
+
+    async def _read(self, sql, params):
+        return await run_io(self._fetchone, sql, params)
+
+    async def _write(self, sql, params):
+        await run_locked_io(self.database, self._execute, sql, params)
+
+    async def get(self, user_id):
+        row = await self._read(SQL_GET_USER, (user_id,))
+        return dict(row) if row else {}
+
+    async def is_banned(self, user_id):
+        return await self._read(SQL_IS_BANNED, (user_id,)) is not None
+
+    async def lookup(self, user_id):
+        row = await self._read(SQL_LOOKUP, {'user_id': user_id})
+        user_info = {name: row[name] for name in USER_FIELDS} if row['user_id'] is not None else {}
+        return user_info, bool(row['banned'])
+
+    async def find_by_license(self, license):
+        row = await self._read(SQL_FIND_LICENSE, (license,))
+        return dict(row) if row else {}
+
+    async def iter_users(self):
+        # user_id 기준으로 page_size 개씩 끊어서 가져옴
+        last_id = -1
+        while True:
+            rows = await run_io(self._fetchall, SQL_PAGE_USERS, (last_id, self.page_size))
+            for row in rows:
+                yield dict(row)
+            if len(rows) < self.page_size:
+                return
+            last_id = rows[-1]['user_id']
+
+    async def iter_banlist(self):
+        last_id = -1
+        while True:
+            rows = await run_io(self._fetchall, SQL_PAGE_BANLIST, (last_id, self.page_size))
+            for row in rows:
+                yield row['user_id'], row['reason']
+            if len(rows) < self.page_size:
+                return
+            last_id = rows[-1]['user_id']
+
+    async def page_users(self, offset, limit, plan=None, expires_before=None, licensed=False):
+        clauses = []
+        params = []
+        if licensed:
+            clauses.append("license != ''")
+        if plan:
+            clauses.append("plan = ?")
+            params.append(plan)
+        if expires_before:
+            clauses.append("expiry_date != '' AND expiry_date <= ?")
+            params.append(expires_before)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT {SQL_USER_COLUMNS} FROM users{where} ORDER BY user_id LIMIT ? OFFSET ?"
+        rows = await run_io(self._fetchall, sql, (*params, limit, offset))
+        return [dict(row) for row in rows]
+
+    async def page_banlist(self, offset, limit):
+        rows = await run_io(self._fetchall, SQL_OFFSET_BANLIST, (limit, offset))
+        return [(row['user_id'], row['reason']) for row in rows]
+
+    def _user_columns(self):
+        with self._reader() as conn:
+            plans = conn.execute(SQL_STATS_PLANS).fetchall()
+            unlicensed = conn.execute(SQL_STATS_UNLICENSED).fetchone()[0]
+            expiry = conn.execute(SQL_STATS_EXPIRY).fetchall()
+            created = conn.execute(SQL_STATS_CREATED).fetchall()
+        return {
+            'plan': array('b', [_stored_plan_code(row[0]) for row in plans]),
+            'plan_weights': array('q', [row[1] for row in plans]),
+            'expiry': array('q', [_stored_date_ordinal(row[0]) for row in expiry]),
+            'expiry_weights': array('q', [row[1] for row in expiry]),
+            'created': array('q', [row[0] for row in created]),
+            'created_weights': array('q', [row[1] for row in created]),
+            'licensed': sum(row[1] for row in plans) - unlicensed
+        }
+
+    async def user_columns(self):
+        return await run_io(self._user_columns)
+
+    async def license_expiries(self):
+        rows = await run_io(self._fetchall, SQL_LICENSE_EXPIRIES, ())
+        return [tuple(row) for row in rows]
+
+    async def register(self, user_id, username):
+        await self._write(SQL_REGISTER, (user_id, username, int(time.time())))
+
+    async def unregister(self, user_id):
+        await self._write(SQL_UNREGISTER, (user_id,))
+
+    def _update_sql(self, fields):
+        for name in fields:
+            if name not in USER_FIELDS or name == 'user_id':
+                raise ValueError(f"알 수 없는 필드입니다: {name}")
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        return f"UPDATE users SET {columns} WHERE user_id = ?"
+
+    async def update(self, user_id, **fields):
+        await self._write(self._update_sql(fields), (*fields.values(), user_id))
+
+    async def update_many(self, user_ids, **fields):
+        rows = [(*fields.values(), user_id) for user_id in set(user_ids)]
+        await run_locked_io(self.database, self._execute_many, self._update_sql(fields), rows)
+
+    def _assign_license(self, user_id, license, fields):
+        # 같은 트랜잭션 안에서 중복 확인과 변경을 같이 함
+        fields = dict(license=license, **fields)
+        sql = self._update_sql(fields)
+        with self._write_lock, self._writer:
+            # 다른 프로세스가 확인과 변경 사이에 끼어들지 못하게 처음부터 쓰기 잠금을 잡음
+            self._writer.execute("BEGIN IMMEDIATE")
+            owner = self._writer.execute(SQL_LICENSE_OWNER, (license,)).fetchone()
+            if owner is not None and owner['user_id'] != user_id:
+                return False
+            self._writer.execute(sql, (*fields.values(), user_id))
+            return True
+
+    async def assign_license(self, user_id, license, **fields):
+        return await run_locked_io(self.database, self._assign_license, user_id, license, fields)
+
+    def _assigned_licenses(self, licenses):
+        assigned = set()
+        with self._reader() as conn:
+            for i in range(0, len(licenses), 500):
+                chunk = licenses[i:i+500]
+                sql = f"SELECT license FROM users WHERE license IN ({', '.join('?' * len(chunk))})"
+                assigned.update(row['license'] for row in conn.execute(sql, chunk))
+        return assigned
+
+    async def assigned_licenses(self, licenses):
+        return await run_io(self._assigned_licenses, list(licenses))
+
+    def _user_licenses(self, user_ids):
+        licenses = {}
+        with self._reader() as conn:
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i+500]
+                sql = f"SELECT user_id, license FROM users WHERE license != '' AND user_id IN ({', '.join('?' * len(chunk))})"
+                licenses.update((row['user_id'], row['license']) for row in conn.execute(sql, chunk))
+        return licenses
+
+    async def user_licenses(self, user_ids):
+        return await run_io(self._user_licenses, list(user_ids))
+
+    async def ban(self, user_id, reason):
+        await self._write(SQL_BAN, (user_id, reason))
+
+    async def unban(self, user_id):
+        await self._write(SQL_UNBAN, (user_id,))
+
+    def _execute_many(self, sql, rows):
+        with self._write_lock, self._writer:
+            return self._writer.executemany(sql, rows).rowcount
+
+    async def ban_many(self, entries):
+        return await run_locked_io(self.database, self._execute_many, SQL_BAN_IGNORE, list(dict(entries).items()))
+
+    async def unban_many(self, user_ids):
+        return await run_locked_io(self.database, self._execute_many, SQL_UNBAN, [(user_id,) for user_id in set(user_ids)])
+
+    async def close(self):
+        await run_locked_io(self.database, self._close)
+
+    def _close(self):
+        if self._pool is not None:
+            while not self._pool.empty():
+                self._pool.get().close()
+            self._pool = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
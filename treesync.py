@@ -0,0 +1,44 @@
+import hashlib
+import json
+import os
+
+import discord
+
+def _command_payload(tree, command):
+    # discord.py 2.4 부터 to_dict 에 tree 를 넘겨야 함
+    try:
+        return command.to_dict(tree)
+    except TypeError:
+        return command.to_dict()
+
+def tree_hash(tree, guild=None):
+    # 이름, 설명, 옵션, 선택지 등 디스코드에 보내는 내용 그대로 해시함
+    payload = [_command_payload(tree, command) for command in tree.get_commands(guild=guild)]
+    payload.sort(key=lambda command: (command.get('type', 1), command['name']))
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+async def sync_tree(tree, cache_file, guild_id=None, force=False):
+    # 명령어가 바뀌었을 때만 sync 를 보냄, 해시는 봇 (application_id) 과 서버별로 cache_file 에 저장함
+    # guild_id 를 넣으면 전역 명령어를 그 서버에 복사해서 바로 반영되게 함 (개발용)
+    guild = discord.Object(id=guild_id) if guild_id is not None else None
+    if guild is not None:
+        tree.copy_global_to(guild=guild)
+    scope = f"{tree.client.application_id}:{guild_id or 'global'}"
+    digest = tree_hash(tree, guild)
+
+    cache = {}
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+        except json.JSONDecodeError:
+            cache = {}
+    if not force and cache.get(scope) == digest:
+        return False
+
+    await tree.sync(guild=guild)
+    cache[scope] = digest
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f, indent=4)
+    return True